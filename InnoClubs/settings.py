@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 import os
 import socket
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -32,6 +32,12 @@ ALLOWED_HOSTS = config("ALLOWED_HOSTS", default="127.0.0.1, localhost", cast=lam
 
 # Application definition
 
+# API-only workers serve the token authenticated JSON API and nothing else: no admin, sessions,
+# Microsoft login, JWT / session / basic authentication or browsable API. Run the
+# login and admin routes on workers with the full profile. Compare both profiles with
+# `python manage.py benchmark_startup`.
+API_ONLY = config("API_ONLY", default=False, cast=bool)
+
 INSTALLED_APPS = [
 
     'api.apps.ApiConfig',
@@ -54,6 +60,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.db.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,6 +69,36 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if API_ONLY:
+    # allauth's account models stay, deleting a user cascades to its e-mail addresses and social
+    # accounts. The admin log does not: delete staff users on workers with the full profile.
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+        'django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages',
+        'django.contrib.staticfiles', 'allauth.socialaccount.providers.microsoft')]
+    # DRF authenticates the requests itself and its views are exempt from CSRF checks
+    MIDDLEWARE = ['django.middleware.security.SecurityMiddleware', 'api.db.ReplicaMiddleware',
+                  'django.middleware.common.CommonMiddleware']
+
+# Query count, SQL, serialization and render times per request, served as Prometheus text
+# at /metrics (api/instrumentation.py); SERVER_TIMING also sends them in Server-Timing headers
+INSTRUMENTATION = config("INSTRUMENTATION", default=False, cast=bool)
+SERVER_TIMING = config("SERVER_TIMING", default=False, cast=bool)
+# Who may read /metrics: clients with these addresses (REMOTE_ADDR, the proxy's behind one),
+# and clients sending `Authorization: Bearer <METRICS_TOKEN>` when it is set
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="127.0.0.1,::1", cast=Csv())
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+if INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'api.instrumentation.InstrumentationMiddleware')
+
+# Reports requests over their view's query_budget, N+1 patterns (a query template run
+# QUERY_REPEAT_LIMIT times or more) and queries slower than QUERY_SLOW_MS (api/query_inspector.py);
+# 'off', 'log' or 'raise'
+QUERY_INSPECTOR = config("QUERY_INSPECTOR", default="off")
+QUERY_REPEAT_LIMIT = config("QUERY_REPEAT_LIMIT", default=3, cast=int)
+QUERY_SLOW_MS = config("QUERY_SLOW_MS", default=100, cast=int)
+if QUERY_INSPECTOR != 'off':
+    MIDDLEWARE.insert(0, 'api.query_inspector.QueryInspectorMiddleware')
+
 SITE_ID = 1
 
 ROOT_URLCONF = 'InnoClubs.urls'
@@ -88,10 +125,54 @@ WSGI_APPLICATION = 'InnoClubs.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Seconds a connection is kept open and reused by later requests of the same worker thread,
+# 0 closes it after every request
+DATABASE_CONN_MAX_AGE = config("DATABASE_CONN_MAX_AGE", default=60, cast=int)
+# Check reused connections at the start of every request and reconnect if they died, see api/db.py
+DATABASE_HEALTH_CHECKS = config("DATABASE_HEALTH_CHECKS", default=True, cast=bool)
+# Connections go through a transaction pooler (PgBouncer pool_mode = transaction),
+# which cannot keep the server-side cursors of QuerySet.iterator() between transactions
+DATABASE_POOLER = config("DATABASE_POOLER", default=False, cast=bool)
+
+
+def database(url):
+    database = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE)
+    if DATABASE_POOLER:
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return database
+
+
 DATABASES = {
-    'default': config("DATABASE_URL", default="sqlite:///db.sqlite3", cast=dj_database_url.parse)
+    'default': database(config("DATABASE_URL", default="sqlite:///db.sqlite3"))
 }
 
+# Read replicas serving GET requests (see api/db.py), everything goes to default without them
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f'replica{index or ""}'] = dict(database(url), TEST={'MIRROR': 'default'})
+# Seconds a user reads from default after a write, to see it before it reaches the replicas
+DATABASE_PIN_SECONDS = config("DATABASE_PIN_SECONDS", default=10, cast=int)
+
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory by default; point CACHE_BACKEND / CACHE_LOCATION to a shared cache
+# (e.g. django_redis.cache.RedisCache, redis://127.0.0.1:6379/1) when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        'LOCATION': config("CACHE_LOCATION", default="innoclubs"),
+    }
+}
+
+# Seconds serialized club payloads are kept in the cache
+CLUB_CACHE_TIMEOUT = config("CLUB_CACHE_TIMEOUT", default=60, cast=int)
+
+# Clubs read per database round trip by streamed club listings
+CLUB_STREAM_CHUNK_SIZE = config("CLUB_STREAM_CHUNK_SIZE", default=500, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -117,6 +198,8 @@ AUTHENTICATION_BACKENDS = [
     # `allauth` specific authentication methods, such as login by e-mail
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
+if API_ONLY:
+    AUTHENTICATION_BACKENDS = AUTHENTICATION_BACKENDS[:1]
 
 SOCIALACCOUNT_PROVIDERS = {
     'microsoft': {
@@ -150,7 +233,7 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
@@ -158,23 +241,52 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
-    # 'DEFAULT_PAGINATION_CLASS': 'api.utils.CustomPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.utils.CustomPagination',
     'EXCEPTION_HANDLER': "rest_framework.views.exception_handler",
-    # 'PAGE_SIZE': 30,
+    'PAGE_SIZE': 30,
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'api.throttling.AnonRateThrottle',
+        'api.throttling.UserRateThrottle',
+        'api.throttling.ScopedRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'anon': '60/minute',
-        'user': '60/minute'
+        'user': '60/minute',
+        # views with a throttle_scope use the rate of their scope instead
+        'auth_url': '300/minute',
+        'membership': '30/minute',
     },
 }
 
+# Cache holding the throttle counters (api/throttling.py), has to be shared by all workers
+THROTTLE_CACHE = config("THROTTLE_CACHE", default="default")
+# Worker processes per server (gunicorn and uvicorn read it too), checked against a
+# per-process THROTTLE_CACHE, which multiplies the rates by the number of workers
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", default=1, cast=int)
+
+if API_ONLY:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = ('api.authentication.CachedTokenAuthentication',)
+    # logout deletes the token, there is no session to end
+    REST_SESSION_LOGIN = False
+
 # add browser API console if DEBUG mode is enabled
-if DEBUG:
+if DEBUG and not API_ONLY:
     REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
 
+# Threads running the database work of the async views (api/async_views.py) under ASGI
+ASYNC_DATABASE_THREADS = config("ASYNC_DATABASE_THREADS", default=8, cast=int)
+
+# Seconds a response to a request with an Idempotency-Key is replayed for (api/idempotency.py)
+IDEMPOTENCY_KEY_TTL = config("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60, cast=int)
+
+# Token -> user resolutions cached by api.authentication.CachedTokenAuthentication in every worker
+TOKEN_CACHE_SIZE = config("TOKEN_CACHE_SIZE", default=10000, cast=int)
+TOKEN_CACHE_TTL = config("TOKEN_CACHE_TTL", default=60, cast=int)
+# Seconds between checks of a cached token for revocation by another worker (a marker in the
+# shared cache): a revoked token is accepted that much longer, 0 checks on every request at
+# the cost of a shared cache round trip each. Keep it below TOKEN_CACHE_TTL.
+TOKEN_REVOCATION_CHECK_INTERVAL = config("TOKEN_REVOCATION_CHECK_INTERVAL", default=5, cast=int)
+
 # Data for Microsoft Authentication
 AUTHENTICATION_URL = 'https://login.microsoftonline.com/common/oauth2/v2.0/authorize/'
 CALLBACK_URL = config('MICROSOFT_CALLBACK_URL')
@@ -13,13 +13,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
-from api import views
+from api import views, instrumentation
 
 urlpatterns = [
-    path('', views.home),
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', instrumentation.metrics_view, name='metrics'),
 ]
+
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('', views.home),
+        path('admin/', admin.site.urls),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import User, Club
+from .models import User, Club, Membership, MembershipEvent
 
 admin.site.register(User)
 admin.site.register(Club)
+admin.site.register(Membership)
+admin.site.register(MembershipEvent)
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals, throttling  # noqa: F401 (receivers, system checks)
+        if settings.INSTRUMENTATION:
+            from . import instrumentation
+            instrumentation.install()
+        if settings.QUERY_INSPECTOR != 'off':
+            from . import query_inspector
+            query_inspector.install()
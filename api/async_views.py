@@ -0,0 +1,130 @@
+"""
+Async variants of the read endpoints, for ASGI deployments.
+
+Django 3.1 has no async ORM, and under ASGI it runs every sync view on one shared
+thread, so requests queue up behind each other's queries. These views authenticate
+tokens from the token cache in the event loop and run the existing DRF views in a
+pool of ASYNC_DATABASE_THREADS threads: at most that many requests use the database
+at once, the others wait without holding a thread. Invalid and cached tokens are
+handled without a thread at all.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.renderers import JSONRenderer
+
+from . import views
+from .db import prepare_connections
+from .throttling import ClientRateThrottle
+from .authentication import CachedTokenAuthentication, MISSING, REVALIDATE
+from InnoClubs import settings
+
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DATABASE_THREADS, thread_name_prefix='api-database')
+
+
+async def database(func, *args, **kwargs):
+    """
+    Run `func` in the database thread pool, in the current context (replica routing).
+    Connections are reused, checked or closed as in a sync request, request signals
+    do not cover these threads.
+    """
+    def call():
+        prepare_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run, call)
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class EventLoopTokenAuthentication(CachedTokenAuthentication):
+
+    """
+    Token authentication from the token cache only, safe to call in the event loop.
+    Keys which are not cached or are due for the revocation check raise CacheMiss with
+    the function resolving them, to be called in the pool.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = self.cache.get(key, check_revoked=False)
+        if cached is MISSING:
+            raise CacheMiss(key, self.lookup)
+        if cached is REVALIDATE:
+            # the revocation marker is read from the shared cache, a blocking call
+            raise CacheMiss(key, self.resolve)
+        return self.check(cached)
+
+
+async def authenticate(request):
+    """
+    (user, token) for `Token` credentials, None for other or no credentials
+    (the DRF view authenticates those in the pool).
+    """
+    authenticator = EventLoopTokenAuthentication()
+    try:
+        return authenticator.authenticate(request)
+    except CacheMiss as miss:
+        key, resolve = miss.args
+        cached = await database(resolve, key)
+    return authenticator.check(cached)
+
+
+def render(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    return response.render() if hasattr(response, 'render') else response
+
+
+def json_response(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def bridge(view_class, methods=('GET', 'HEAD', 'OPTIONS')):
+    """
+    Async view running `view_class` in the database pool, for the given methods.
+    """
+    view = view_class.as_view()
+
+    async def async_view(request, *args, **kwargs):
+        if request.method not in methods:
+            return HttpResponseNotAllowed(methods)
+        try:
+            auth = await authenticate(request)
+        except AuthenticationFailed as exc:
+            response = json_response({'detail': exc.detail}, status=exc.status_code)
+            response['WWW-Authenticate'] = EventLoopTokenAuthentication().authenticate_header(request)
+            return response
+        if auth is not None:
+            # DRF skips its authenticators for requests carrying a forced user / token
+            request._force_auth_user, request._force_auth_token = auth
+        return await database(render, view, request, *args, **kwargs)
+
+    async_view.csrf_exempt = True  # DRF views enforce CSRF for session authentication themselves
+    return async_view
+
+
+list_clubs = bridge(views.ListClubsView)
+retrieve_club = bridge(views.RUDClubView)
+
+
+async def get_auth_url(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    # the scope of the sync view, on the client address: the request is not authenticated here
+    throttle = ClientRateThrottle()
+    if not throttle.allow_request(request, get_auth_url):
+        exc = Throttled(throttle.wait())
+        response = json_response({'detail': exc.detail}, status=exc.status_code)
+        response['Retry-After'] = '%d' % exc.wait
+        return response
+    return json_response(views.auth_url_data())
+
+
+get_auth_url.throttle_scope = 'auth_url'
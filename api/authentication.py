@@ -0,0 +1,165 @@
+"""
+Token authentication with an in-process cache of token -> user resolution.
+
+Entries live for TOKEN_CACHE_TTL seconds, at most TOKEN_CACHE_SIZE of them are kept
+(least recently used are evicted first). Unknown tokens are cached too, so repeated
+bad tokens do not hit the database either. Signals drop entries when a token is
+deleted (logout, rotation, user deletion) or its user changes.
+
+Other workers learn about it from a revocation marker in the shared cache (`revoke()`),
+checked on a hit of a known token at most every TOKEN_REVOCATION_CHECK_INTERVAL seconds
+per entry: while the marker is there (TOKEN_CACHE_TTL seconds, longer than any entry
+cached before it), the token is looked up again. A token revoked on another worker is
+accepted for up to the interval, in exchange for most hits not leaving the process.
+The async views make the check in their database threads, not in the event loop.
+Profile changes (names) are not revoked, the cached user may show the old ones until
+the TTL runs out. With a per-process cache (LocMemCache) workers do not see each
+other's markers. Hits and misses are exported at /metrics (api/instrumentation.py).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+MISSING = object()
+REVALIDATE = object()  # a hit due for the revocation check, see TokenCache.get
+
+
+def revoked_key(key):
+    return f'auth:revoked:{key}'
+
+
+def revoke(*keys):
+    """
+    Make every worker look the tokens up again instead of trusting their cached entries.
+    Marked again after the commit: until then other workers may cache the old rows.
+    """
+    def mark():
+        cache.set_many({revoked_key(key): True for key in keys}, timeout=settings.TOKEN_CACHE_TTL)
+    if keys:
+        mark()
+        transaction.on_commit(mark)
+
+
+class TokenCache:
+
+    def __init__(self, maxsize, ttl, check_interval=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> [expires, (user, token) or None, last revocation check]
+        self._user_keys = {}  # user pk -> keys, to drop the entries of a user
+        self._lock = threading.Lock()
+
+    def get(self, key, check_revoked=True):
+        """
+        The cached (user, token) or None of the key, MISSING if it is not cached. Without
+        `check_revoked`, a hit due for the revocation check returns REVALIDATE instead.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            if entry[1] is None or now - entry[2] < self.check_interval:
+                self.hits += 1
+                return entry[1]
+        if not check_revoked:
+            return REVALIDATE
+        if cache.get(revoked_key(key)):
+            self.delete(key)
+            with self._lock:
+                self.misses += 1
+            return MISSING
+        with self._lock:
+            entry[2] = now
+            self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._pop(key)
+            now = time.monotonic()
+            self._entries[key] = [now + self.ttl, value, now]
+            if value is not None:
+                self._user_keys.setdefault(value[0].pk, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def delete_user(self, user_pk):
+        with self._lock:
+            for key in list(self._user_keys.get(user_pk, ())):
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            keys = self._user_keys[entry[1][0].pk]
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[entry[1][0].pk]
+
+
+token_cache = TokenCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL,
+                         check_interval=settings.TOKEN_REVOCATION_CHECK_INTERVAL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    """
+    headers - {'Authorization': f'Token {token itself}'}
+    """
+
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        return self.check(self.resolve(key))
+
+    def resolve(self, key):
+        cached = self.cache.get(key)
+        if cached is MISSING:
+            cached = self.lookup(key)
+        return cached
+
+    def lookup(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+            cached = (token.user, token)
+        except model.DoesNotExist:
+            cached = None
+        self.cache.set(key, cached)
+        return cached
+
+    def check(self, cached):
+        if cached is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, token = cached
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # every request gets its own instance, changes to request.user must not leak into the cache
+        return copy.copy(user), token
@@ -0,0 +1,97 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks seed their data inside a transaction that is rolled back at the end,
+so they can be run against a development database without leaving anything behind.
+"""
+import json
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .models import User, Club
+
+
+@contextmanager
+def rolled_back(using=None):
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summary(samples):
+    """
+    Latency summary in milliseconds for a list of durations in seconds.
+    """
+    samples = [sample * 1000 for sample in samples]
+    return {'p50': percentile(samples, 50),
+            'p95': percentile(samples, 95),
+            'p99': percentile(samples, 99),
+            'mean': statistics.mean(samples)}
+
+
+def measure(func, arguments):
+    """
+    Call `func` once per item of `arguments` and return the durations in seconds.
+    """
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        func(argument)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def format_summary(name, result):
+    return f'{name:<40} p50={result["p50"]:.3f}ms p95={result["p95"]:.3f}ms ' \
+           f'p99={result["p99"]:.3f}ms mean={result["mean"]:.3f}ms'
+
+
+def seed_users(count, prefix='bench'):
+    users = [User(email=f'{prefix}-{i}@innopolis.university', username=f'{prefix}-{i}')
+             for i in range(count)]
+    return User.objects.bulk_create(users, batch_size=1000)
+
+
+def seed_clubs(count, heads, prefix='Bench club'):
+    clubs = [Club(title=f'{prefix} {i}', description=f'Description of {prefix.lower()} {i}',
+                  head_of_the_club=heads[i % len(heads)])
+             for i in range(count)]
+    return Club.objects.bulk_create(clubs, batch_size=1000)
+
+
+async def asgi_request(application, method, path, body=None, token=None):
+    """
+    Send one request to an ASGI application in-process, as a server would, and return
+    the status and headers of the response. `body` is sent as JSON, the token as `Token` credentials.
+    """
+    path, _, query = path.partition('?')
+    data = json.dumps(body).encode() if body else b''
+    headers = [(b'host', b'localhost'), (b'content-type', b'application/json'),
+               (b'content-length', str(len(data)).encode())]
+    if token:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'query_string': query.encode(), 'server': ('localhost', 80),
+             'headers': headers}
+    messages = [{'type': 'http.request', 'body': data, 'more_body': False}]
+    response = {}
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response.update(status=message['status'],
+                            headers={key.decode(): value.decode() for key, value in message['headers']})
+
+    await application(scope, receive, send)
+    return response['status'], response['headers']
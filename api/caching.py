@@ -0,0 +1,106 @@
+"""
+Cache of serialized club payloads.
+
+    - clubs:club:<pk> - payload of one club (RUDClubView)
+    - clubs:list:<generation>:<url hash> - one page of ListClubsView
+    - clubs:user:<version>:<user pk>:<relation> - clubs of a user (MyClubsView)
+
+A club change deletes its own key and starts a new list generation, which orphans
+every cached page at once (they expire by timeout). User club lists have a version per
+user instead, dropped when the user joins or leaves and when a club of theirs is edited,
+handed over or deleted, so writes elsewhere leave them cached. The member counts in them
+follow the joins of other users within CLUB_CACHE_TIMEOUT. Keys are invalidated right away
+and once more after the transaction commits, so a concurrent reader cannot put
+the pre-commit state back into the cache.
+
+Works with any Django cache backend. With LocMemCache every worker has its own
+cache and only sees its own invalidations, so CLUB_CACHE_TIMEOUT bounds staleness
+across workers; use a shared backend (Redis, Memcached) in production.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import db
+from .models import Membership
+
+GENERATION_KEY = 'clubs:list:generation'
+
+
+def club_key(pk):
+    return f'clubs:club:{pk}'
+
+
+def version(key):
+    value = cache.get(key)
+    if value is None:
+        # a fresh random value, never one of an evicted version
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def list_generation():
+    return version(GENERATION_KEY)
+
+
+def user_version_key(user_pk):
+    return f'clubs:user-version:{user_pk}'
+
+
+def list_key(url):
+    return f'clubs:list:{list_generation()}:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def user_clubs_key(user_pk, relation):
+    return f'clubs:user:{version(user_version_key(user_pk))}:{user_pk}:{relation}'
+
+
+def get_or_set(key, build):
+    """
+    Cached payload under `key`, built with `build()` on a miss. Users pinned to default
+    after a write skip the cache: an entry may have been built from a replica lagging behind it.
+    """
+    if db.pinned_to_default():
+        return build()
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.CLUB_CACHE_TIMEOUT)
+    return data
+
+
+def _invalidate(club_pks):
+    cache.delete_many([club_key(pk) for pk in club_pks])
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_clubs(*club_pks):
+    """
+    Drop cached payloads of the given clubs and every cached club list.
+    """
+    _invalidate(club_pks)
+    transaction.on_commit(lambda: _invalidate(club_pks))
+
+
+def _invalidate_users(user_pks):
+    cache.delete_many([user_version_key(pk) for pk in user_pks])
+
+
+def invalidate_user_lists(*user_pks):
+    """
+    Drop the cached club lists of the given users.
+    """
+    _invalidate_users(user_pks)
+    transaction.on_commit(lambda: _invalidate_users(user_pks))
+
+
+def invalidate_member_lists(*club_pks):
+    """
+    Drop the cached club lists of the members (heads included) of the given clubs.
+    """
+    members = Membership.objects.filter(club_id__in=club_pks).values_list('user_id', flat=True).distinct()
+    invalidate_user_lists(*members)
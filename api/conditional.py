@@ -0,0 +1,32 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+
+    """
+    Conditional GET for API views.
+
+    `get_validators()` returns (state, last modified datetime) of the resource, computed
+    without serializing it. The strong ETag is a hash of the state, so If-None-Match /
+    If-Modified-Since requests are answered with 304 before the body is built.
+    """
+
+    def get_validators(self):
+        raise NotImplementedError
+
+    def conditional_get(self, request, build_response):
+        state, last_modified = self.get_validators()
+        etag = quote_etag(hashlib.md5(repr(state).encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = build_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
@@ -0,0 +1,154 @@
+"""
+Database connection handling: read replica routing and connection health checks.
+
+Reads of `api` models (clubs, users, memberships) in requests with a safe method (GET,
+HEAD, OPTIONS) go to one of the replica aliases (`replica`, `replica1`, ..., one per
+DATABASE_REPLICA_URLS entry), writes and every other request use `default`. The
+middleware keeps the request in a context variable the router reads, so code running
+outside a request (commands, signals of other requests) keeps using `default`.
+
+Replicas lag behind. A user who wrote something is pinned to `default` for
+DATABASE_PIN_SECONDS to read their own writes: the pin is stored in the cache (shared
+by the workers) when an unsafe request succeeds, and checked once the request is
+authenticated (DRF sets the user on the Django request). Reads made before that,
+the authentication itself included, go to `default`. Pinned users bypass the shared club
+cache (api/caching.py) too, its entries may have been built from a replica before the write.
+
+Django 3.1 has no CONN_HEALTH_CHECKS: with persistent connections (CONN_MAX_AGE) a
+connection dropped by the server or a pooler would fail the next request reusing it.
+`check_connections()` pings reused connections when a request starts and closes the
+dead ones, so Django reconnects on first use.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, close_old_connections
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+from .utils import AsyncCapableMiddleware
+
+REPLICA = 'replica'
+
+current_request = ContextVar('current_request', default=None)
+
+
+def replicas():
+    return [alias for alias in connections.databases if alias.startswith(REPLICA)]
+
+
+def pin_key(user_pk):
+    return f'db-pin:{user_pk}'
+
+
+def pin(user):
+    cache.set(pin_key(user.pk), True, timeout=settings.DATABASE_PIN_SECONDS)
+
+
+def request_user(request):
+    """
+    The authenticated user of the request, None while it is unknown or anonymous.
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # evaluating the session user would query the database from within the router
+        return None
+    return user if user is not None and user.is_authenticated else None
+
+
+class RequestState:
+
+    def __init__(self, request):
+        self.request = request
+        self.safe = request.method in SAFE_METHODS
+        self.pinned = None
+
+    def is_pinned(self):
+        if self.pinned is None:
+            user = request_user(self.request)
+            if user is None:
+                return False
+            self.pinned = cache.get(pin_key(user.pk), False)
+        return self.pinned
+
+    def use_replica(self):
+        return self.safe and request_user(self.request) is not None and not self.is_pinned()
+
+
+def pinned_to_default():
+    """
+    Whether the user of the current request is pinned to default while replicas are in use.
+    """
+    state = current_request.get()
+    return state is not None and bool(replicas()) and state.is_pinned()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = current_request.get()
+        if state is None or model._meta.app_label != 'api':
+            return None
+        aliases = replicas()
+        if aliases and state.use_replica():
+            return random.choice(aliases)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # instances read from a replica are the same rows as on default
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get the schema through replication
+        return not db.startswith(REPLICA)
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+
+    # streamed responses are consumed after these return and read from default
+
+    def call(self, request):
+        token = current_request.set(RequestState(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    async def acall(self, request):
+        # sync views and the database pool of the async views run in copies of this context
+        token = current_request.set(RequestState(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.pin_writer(request, response)
+        return response
+
+    @staticmethod
+    def pin_writer(request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user = request_user(request)
+            if user is not None:
+                pin(user)
+
+
+def check_connections(**kwargs):
+    for connection in connections.all():
+        if connection.connection is not None and not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
+
+
+def prepare_connections():
+    """
+    What request_started does to the connections, for threads outside the request cycle.
+    """
+    close_old_connections()
+    if settings.DATABASE_HEALTH_CHECKS:
+        check_connections()
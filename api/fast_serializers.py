@@ -0,0 +1,87 @@
+"""
+Read-only fast path for club listings.
+
+Builds the same dicts as ListClubsSerializer / RetrieveClubsSerializer straight from
+`.values()` rows, skipping DRF's field-by-field serialization and model instantiation.
+The output has to stay identical to the serializers' (see ClubsFastPathTest),
+so a field added there has to be added here as well.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from rest_framework.renderers import JSONRenderer
+
+from .instrumentation import timed
+from .models import ClubQuerySet, Membership
+
+USER_FIELDS = ClubQuerySet.USER_FIELDS
+HEAD_FIELDS = tuple(f'head_of_the_club__{field}' for field in USER_FIELDS)
+
+
+def club_rows(queryset):
+    """
+    `.values()` queryset of clubs with the columns of the listing and their heads.
+    """
+    return queryset.values('id', 'title', 'description', 'member_count', *HEAD_FIELDS)
+
+
+def fetch_members(club_ids):
+    """
+    Members of the given clubs ordered by email, as {club id: [user dict, ...]}.
+    """
+    members = defaultdict(list)
+    rows = Membership.objects.filter(club_id__in=club_ids) \
+                             .order_by('club_id', 'user__email') \
+                             .values_list('club_id', *(f'user__{field}' for field in USER_FIELDS))
+    for club_id, *user in rows:
+        members[club_id].append(dict(zip(USER_FIELDS, user)))
+    return members
+
+
+@timed('serialize')
+def build_clubs(rows, members, members_limit=None):
+    """
+    Club payloads for `.values()` rows, see ListClubsSerializer for `members_limit`.
+    """
+    data = []
+    for row in rows:
+        club = {'title': row['title'],
+                'description': row['description'],
+                'head_of_the_club': {field: row[head_field] for field, head_field in zip(USER_FIELDS, HEAD_FIELDS)}}
+        if members_limit != 0:
+            club['members'] = members[row['id']][:members_limit]
+        club['member_count'] = row['member_count']
+        data.append(club)
+    return data
+
+
+def serialize_clubs(rows, members_limit=None):
+    rows = list(rows)
+    members = fetch_members([row['id'] for row in rows]) if members_limit != 0 else {}
+    return build_clubs(rows, members, members_limit)
+
+
+def iter_clubs(rows, members_limit=None, chunk_size=500):
+    """
+    Club payloads for a `.values()` queryset, read `chunk_size` rows at a time from a
+    server-side cursor. Members are fetched per chunk, so memory does not grow with the listing.
+    """
+    rows = rows.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from serialize_clubs(chunk, members_limit)
+
+
+def stream_json(items):
+    """
+    Render an iterable as a JSON array, one item at a time. The bytes are the same
+    as JSONRenderer's for the whole list.
+    """
+    renderer = JSONRenderer()
+    separator = b'['
+    for item in items:
+        yield separator + renderer.render(item)
+        separator = b','
+    yield b']' if separator == b',' else b'[]'
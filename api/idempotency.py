@@ -0,0 +1,95 @@
+"""
+Idempotency-Key support for unsafe API requests.
+
+A client retrying a request it did not get an answer to sends the same
+`Idempotency-Key` header again. The first response (anything but a server error) is
+stored for IDEMPOTENCY_KEY_TTL seconds per user, path and key, and replayed with an
+`Idempotent-Replayed: true` header instead of running the request again. A retry
+arriving while the first request still runs gets 409, the same key with a different
+body gets 422. Requests without the header are not affected.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+IN_FLIGHT_TIMEOUT = 60  # a request that died without a response frees its key after this long
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still in progress.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request body.'
+    default_code = 'idempotency_key_mismatch'
+
+
+class Replay(Exception):
+
+    def __init__(self, stored):
+        self.status, self.data = stored
+
+
+class IdempotencyMixin:
+
+    """
+    For API views: handles the `Idempotency-Key` header of unsafe requests,
+    after authentication, permissions and throttling.
+    """
+
+    idempotency_key = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if not key or request.method in SAFE_METHODS:
+            return
+        cache_key = f'idempotency:{request.user.pk}:{request.path}:{key}'
+        fingerprint = hashlib.md5(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+        if cache.add(cache_key, (fingerprint, None), IN_FLIGHT_TIMEOUT):
+            self.idempotency_key = (cache_key, fingerprint)
+            return
+        stored = cache.get(cache_key)
+        if stored is None:  # expired in between, start over
+            return self.initial(request, *args, **kwargs)
+        if stored[0] != fingerprint:
+            raise IdempotencyKeyMismatch()
+        if stored[1] is None:
+            raise IdempotencyKeyInUse()
+        raise Replay(stored[1])
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return Response(exc.data, status=exc.status, headers={'Idempotent-Replayed': 'true'})
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self.release_idempotency_key()  # unhandled errors become 500s, a retry may run again
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency_key is not None:
+            if response.status_code >= 500:
+                self.release_idempotency_key()
+            else:
+                cache_key, fingerprint = self.idempotency_key
+                cache.set(cache_key, (fingerprint, (response.status_code, response.data)),
+                          settings.IDEMPOTENCY_KEY_TTL)
+                self.idempotency_key = None
+        return response
+
+    def release_idempotency_key(self):
+        if self.idempotency_key is not None:
+            cache.delete(self.idempotency_key[0])
+            self.idempotency_key = None
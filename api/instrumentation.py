@@ -0,0 +1,228 @@
+"""
+Per-request instrumentation: query count, SQL time, serialization time and render time.
+
+Enabled with INSTRUMENTATION, which adds InstrumentationMiddleware in front of the
+middleware stack and, on startup, hooks into:
+
+    - every database connection (an execute wrapper counting and timing queries)
+    - DRF serializers (`.data`) and renderers (`JSONRenderer.render`)
+    - the fast path club serializers (`timed('serialize')` below)
+
+Timings of a request are collected in a context variable, so queries run by the
+async views in their database threads are counted too. With SERVER_TIMING every
+response gets a Server-Timing header, and every request is aggregated per URL name
+(see api/urls.py) into the Prometheus text served at /metrics, along with the hits and
+misses of the token cache (api/authentication.py). /metrics answers METRICS_ALLOWED_IPS
+(local addresses by default) and bearers of METRICS_TOKEN only. Metrics are kept per
+worker process, scrape each worker or sum them up in Prometheus.
+
+When disabled nothing is installed; `timed` costs one context variable lookup.
+"""
+import functools
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from rest_framework import renderers, serializers
+
+from .authentication import token_cache
+from .utils import AsyncCapableMiddleware
+
+current = ContextVar('instrumentation', default=None)
+
+
+class Timings:
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.active = set()  # kinds being timed, nested calls are counted once
+
+
+def timed(kind):
+    """
+    Add the time spent in the decorated function to `kind` of the current request.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current.get()
+            if timings is None or kind in timings.active:
+                return func(*args, **kwargs)
+            timings.active.add(kind)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                setattr(timings, kind, getattr(timings, kind) + time.perf_counter() - start)
+                timings.active.discard(kind)
+        return wrapper
+    return decorator
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += time.perf_counter() - start
+
+
+def add_execute_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_installed = False
+
+
+def install():
+    """
+    Hook into database connections, DRF serializers and renderers, once per process.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(add_execute_wrapper)
+    for connection in connections.all():  # opened before, in this thread
+        add_execute_wrapper(None, connection)
+    data = serializers.BaseSerializer.data
+    serializers.BaseSerializer.data = property(timed('serialize')(data.fget))
+    renderers.JSONRenderer.render = timed('render')(renderers.JSONRenderer.render)
+
+
+class Metrics:
+
+    """
+    Latency histogram and time totals per URL name, in Prometheus text format.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._views = {}  # URL name -> [bucket counts, count, sum, queries, db, serialize, render]
+        self._lock = threading.Lock()
+
+    def observe(self, view, duration, timings):
+        with self._lock:
+            entry = self._views.get(view)
+            if entry is None:
+                entry = self._views[view] = [[0] * len(self.BUCKETS), 0, 0.0, 0, 0.0, 0.0, 0.0]
+            buckets = entry[0]
+            for i, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            entry[1] += 1
+            entry[2] += duration
+            entry[3] += timings.queries
+            entry[4] += timings.db
+            entry[5] += timings.serialize
+            entry[6] += timings.render
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        with self._lock:
+            views = sorted((view, [list(entry[0]), *entry[1:]]) for view, entry in self._views.items())
+        lines = ['# HELP innoclubs_request_duration_seconds Request latency per URL name.',
+                 '# TYPE innoclubs_request_duration_seconds histogram']
+        for view, (buckets, count, total, *_) in views:
+            for bound, value in zip(self.BUCKETS, buckets):
+                lines.append(f'innoclubs_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {value}')
+            lines += [f'innoclubs_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}',
+                      f'innoclubs_request_duration_seconds_sum{{view="{view}"}} {total}',
+                      f'innoclubs_request_duration_seconds_count{{view="{view}"}} {count}']
+        for i, (name, description) in enumerate((
+                ('db_queries_total', 'Database queries'),
+                ('db_duration_seconds_total', 'Time spent in database queries'),
+                ('serialize_duration_seconds_total', 'Time spent in serializers'),
+                ('render_duration_seconds_total', 'Time spent rendering responses')), start=3):
+            lines += [f'# HELP innoclubs_{name} {description} per URL name.',
+                      f'# TYPE innoclubs_{name} counter']
+            lines += [f'innoclubs_{name}{{view="{view}"}} {entry[i]}' for view, entry in views]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def server_timing(timings, duration):
+    return f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries", ' \
+           f'serialize;dur={timings.serialize * 1000:.2f}, render;dur={timings.render * 1000:.2f}, ' \
+           f'total;dur={duration * 1000:.2f}'
+
+
+class InstrumentationMiddleware(AsyncCapableMiddleware):
+
+    def call(self, request):
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.observe(request, response, timings, time.perf_counter() - start)
+
+    async def acall(self, request):
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.observe(request, response, timings, time.perf_counter() - start)
+
+    @staticmethod
+    def observe(request, response, timings, duration):
+        match = request.resolver_match
+        view = match.url_name if match is not None and match.url_name else 'unresolved'
+        if view != 'metrics':
+            metrics.observe(view, duration, timings)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timings, duration)
+        return response
+
+
+def token_cache_metrics():
+    stats = token_cache.stats()
+    return '\n'.join([
+        '# HELP innoclubs_token_cache_hits_total Token authentications served from the token cache.',
+        '# TYPE innoclubs_token_cache_hits_total counter',
+        f'innoclubs_token_cache_hits_total {stats["hits"]}',
+        '# HELP innoclubs_token_cache_misses_total Token authentications looked up in the database.',
+        '# TYPE innoclubs_token_cache_misses_total counter',
+        f'innoclubs_token_cache_misses_total {stats["misses"]}',
+        '# HELP innoclubs_token_cache_entries Tokens in the token cache.',
+        '# TYPE innoclubs_token_cache_entries gauge',
+        f'innoclubs_token_cache_entries {stats["size"]}',
+    ]) + '\n'
+
+
+def metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' \
+        and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+
+
+def metrics_view(request):
+    if not settings.INSTRUMENTATION:
+        raise Http404
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render() + token_cache_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
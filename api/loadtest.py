@@ -0,0 +1,332 @@
+"""
+Load driver replaying a mix of the API's user flows.
+
+Virtual users (one thread each) run flows picked at random by weight, with a
+seeded generator so runs are reproducible:
+
+    - login: GET get_auth_url, then the user's profile with their token (the OAuth
+      exchange with Microsoft in between cannot be replayed locally)
+    - list clubs: GET get_clubs with 5 members per club
+    - join / leave: a club the user is not / is a member of
+    - change head: hand the user's own club to a member and back
+
+Requests go through a transport: the WSGI or ASGI application in-process, or a server
+over HTTP. In-process, throttling is off and InstrumentationMiddleware reports the
+queries of every request in its Server-Timing header; over HTTP that needs the server
+to run with INSTRUMENTATION and SERVER_TIMING (and high throttle rates).
+
+The data comes from `python manage.py seed_data`: users `<prefix>-<n>@...` with tokens,
+and clubs `<Prefix> club <n>` headed by them.
+"""
+import asyncio
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+
+from . import benchmark, instrumentation, search
+from .models import User, Club, Membership
+
+FLOWS = {'login': 10, 'list clubs': 50, 'join': 15, 'leave': 15, 'change head': 10}
+
+_queries = re.compile(r'desc="(\d+) queries"')
+
+
+def seed(users, clubs, memberships, rng, prefix='load'):
+    """
+    Users with tokens, clubs headed by the first `clubs` users, and `memberships` random
+    clubs joined by every user. Every head has the next user as a member of their club.
+    """
+    users = benchmark.seed_users(users, prefix=prefix)
+    tokens = [Token(user=user) for user in users]
+    for token in tokens:
+        token.key = token.generate_key()
+    Token.objects.bulk_create(tokens, batch_size=1000)
+    pks = [club.pk for club in benchmark.seed_clubs(clubs, users, prefix=f'{prefix.capitalize()} club')]
+    if not pks or pks[0] is None:  # backends not returning the ids of bulk inserts
+        pks = list(Club.objects.filter(title__startswith=f'{prefix.capitalize()} club ')
+                               .order_by('id').values_list('pk', flat=True))
+
+    pairs = set()
+    for i, pk in enumerate(pks):
+        pairs.update({(pk, users[i % len(users)].pk), (pk, users[(i + 1) % len(users)].pk)})
+    for user in users:
+        pairs.update((pk, user.pk) for pk in rng.sample(pks, min(memberships, len(pks))))
+    Membership.objects.bulk_create([Membership(club_id=pk, user_id=email) for pk, email in sorted(pairs)],
+                                   batch_size=5000)
+    counts = Membership.objects.filter(club_id=OuterRef('pk')).order_by() \
+                               .values('club_id').annotate(count=Count('*')).values('count')
+    Club.objects.filter(pk__in=pks).update(member_count=Subquery(counts))
+    search.index_clubs(pks)
+    return users, pks
+
+
+def clear(prefix='load'):
+    Club.objects.filter(title__startswith=f'{prefix.capitalize()} club ').delete()
+    User.objects.filter(email__startswith=f'{prefix}-').delete()
+
+
+class VirtualUser:
+
+    def __init__(self, rng, email, token, titles, joined, own_club=None, keep=()):
+        self.rng = rng
+        self.email = email
+        self.token = token
+        self.titles = titles
+        self.joined = set(joined)
+        self.own_club = own_club  # (title, member email, member token) or None
+        self.keep = set(keep)  # clubs not to leave: heads cannot, members of handed over clubs must not
+
+    def requests(self):
+        """
+        The requests of the next flow, as (name, method, path, body, token).
+        """
+        flow = self.rng.choices(list(FLOWS), weights=list(FLOWS.values()))[0]
+        if flow == 'leave' and not self.leavable():
+            flow = 'join'
+        if flow == 'change head' and self.own_club is None:
+            flow = 'list clubs'
+
+        if flow == 'login':
+            return [('get auth url', 'GET', '/api/get_auth_url/', None, None),
+                    ('user profile', 'GET', '/api/user_profile/', {'email': self.email}, self.token)]
+        if flow == 'list clubs':
+            return [('list clubs', 'GET', '/api/get_clubs/?members=5', None, self.token)]
+        if flow == 'join':
+            candidates = [title for title in self.rng.sample(self.titles, min(10, len(self.titles)))
+                          if title not in self.joined]
+            if not candidates:
+                return [('list clubs', 'GET', '/api/get_clubs/?members=5', None, self.token)]
+            self.joined.add(candidates[0])
+            return [('join', 'PUT', '/api/join_club/', {'title': candidates[0]}, self.token)]
+        if flow == 'leave':
+            title = self.rng.choice(sorted(self.leavable()))
+            self.joined.discard(title)
+            return [('leave', 'PUT', '/api/leave_club/', {'title': title}, self.token)]
+        title, member, member_token = self.own_club
+        return [('change head', 'PUT', '/api/change_club_header/',
+                 {'title': title, 'new_head_of_the_club': member}, self.token),
+                ('change head', 'PUT', '/api/change_club_header/',
+                 {'title': title, 'new_head_of_the_club': self.email}, member_token)]
+
+    def leavable(self):
+        return self.joined - self.keep
+
+
+def virtual_users(count, seed, prefix='load'):
+    """
+    `count` virtual users for the seeded users, each with a generator of its own (seeded from `seed`).
+    """
+    tokens = dict(Token.objects.filter(user__email__startswith=f'{prefix}-').values_list('user_id', 'key'))
+    emails = sorted(tokens, key=lambda email: int(email.split('@')[0].rsplit('-', 1)[1]))
+    if count > len(emails):
+        raise ValueError(f'{count} virtual users need as many seeded users, there are {len(emails)}')
+    clubs = Club.objects.filter(title__startswith=f'{prefix.capitalize()} club ')
+    titles = sorted(clubs.values_list('title', flat=True))
+    joined = {}
+    for title, email in Membership.objects.filter(club__in=clubs, user_id__in=emails[:count]) \
+                                          .values_list('club__title', 'user_id'):
+        joined.setdefault(email, set()).add(title)
+    own = {}
+    for title, head in clubs.filter(head_of_the_club__in=emails[:count]).values_list('title', 'head_of_the_club'):
+        own.setdefault(head, title)
+
+    users = []
+    for i, email in enumerate(emails[:count]):
+        # seeding made the next user a member of every club
+        member, previous = emails[(i + 1) % len(emails)], emails[i - 1]
+        own_club = (own[email], member, tokens[member]) if email in own and member != email else None
+        keep = {title for head, title in own.items() if head in (email, previous)}
+        users.append(VirtualUser(random.Random(f'{seed}:{i}'), email, tokens[email], titles,
+                                 joined.get(email, ()), own_club, keep))
+    return users
+
+
+class WSGITransport:
+
+    name = 'wsgi'
+
+    def __init__(self):
+        self.application = get_wsgi_application()
+        self.factory = RequestFactory()
+
+    def request(self, method, path, body, token):
+        extra = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        environ = self.factory.generic(method, path, json.dumps(body) if body else '',
+                                       content_type='application/json', HTTP_HOST='localhost', **extra).environ
+        response = {}
+        chunks = self.application(environ, lambda status, headers: response.update(status=status, headers=headers))
+        try:
+            b''.join(chunks)
+        finally:
+            chunks.close()
+        return int(response['status'].split()[0]), dict(response['headers'])
+
+    def close(self):
+        connections.close_all()
+
+
+class ASGITransport:
+
+    """
+    The application runs on an event loop of its own, requests are submitted from the virtual users' threads.
+    """
+
+    name = 'asgi'
+
+    def __init__(self):
+        self.application = get_asgi_application()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body, token):
+        return asyncio.run_coroutine_threadsafe(
+            benchmark.asgi_request(self.application, method, path, body, token), self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class HTTPTransport:
+
+    """
+    A server over HTTP, with one keep-alive connection per virtual user.
+    """
+
+    name = 'http'
+
+    def __init__(self, url):
+        url = urlsplit(url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.local = threading.local()
+
+    def request(self, method, path, body, token):
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        self.local.connection.request(method, path, json.dumps(body) if body else None, headers)
+        response = self.local.connection.getresponse()
+        response.read()
+        return response.status, dict(response.getheaders())
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def in_process():
+    """
+    Throttling off and query counts in Server-Timing headers, for the in-process transports.
+    """
+    instrumentation.install()
+    middleware = [name for name in settings.MIDDLEWARE if name != 'api.instrumentation.InstrumentationMiddleware']
+    get_throttles = APIView.get_throttles
+    APIView.get_throttles = lambda view: []
+    try:
+        with override_settings(INSTRUMENTATION=True, SERVER_TIMING=True,
+                               MIDDLEWARE=['api.instrumentation.InstrumentationMiddleware', *middleware]):
+            yield
+    finally:
+        APIView.get_throttles = get_throttles
+
+
+def run(transport, users, requests=None, duration=None):
+    """
+    Run the virtual users until `requests` requests were sent or `duration` seconds passed,
+    return {endpoint name: [(seconds, status, queries or None), ...]} and the wall time.
+    """
+    samples = {}
+    lock = threading.Lock()
+    sent = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def more():
+        with lock:
+            if requests is not None and sent[0] >= requests:
+                return False
+            sent[0] += 1
+        return deadline is None or time.perf_counter() < deadline
+
+    def work(user):
+        try:
+            while True:
+                for name, method, path, body, token in user.requests():
+                    if not more():
+                        return
+                    start = time.perf_counter()
+                    status, headers = transport.request(method, path, body, token)
+                    elapsed = time.perf_counter() - start
+                    match = _queries.search(headers.get('Server-Timing', ''))
+                    with lock:
+                        samples.setdefault(name, []).append((elapsed, status, match and int(match.group(1))))
+        finally:
+            if transport.name == 'wsgi':
+                transport.close()  # the connections of this thread
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def report(samples, seconds):
+    """
+    JSON-serializable results: latency percentiles (ms), requests/sec, errors and queries per request.
+    """
+    endpoints = {}
+    for name, results in sorted(samples.items()):
+        queries = [count for _, _, count in results if count is not None]
+        endpoints[name] = dict(benchmark.summary([elapsed for elapsed, _, _ in results]),
+                               requests=len(results),
+                               errors=sum(status >= 400 for _, status, _ in results),
+                               rps=len(results) / seconds,
+                               queries=sum(queries) / len(queries) if queries else None)
+    total = sum(len(results) for results in samples.values())
+    return {'requests': total, 'seconds': seconds, 'rps': total / seconds,
+            'errors': sum(endpoint['errors'] for endpoint in endpoints.values()), 'endpoints': endpoints}
+
+
+def compare(results, baseline, tolerance):
+    """
+    (lines describing every change, lines of the regressions beyond `tolerance`, e.g. 0.1 for 10%).
+    """
+    lines, regressions = [], []
+    for name, endpoint in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        for metric, higher_is_worse in (('p50', True), ('p95', True), ('p99', True), ('rps', False)):
+            old, new = before[metric], endpoint[metric]
+            change = (new - old) / old if old else 0.0
+            line = f'{name:<16} {metric:<4} {old:10.3f} -> {new:10.3f} ({change:+.1%})'
+            lines.append(line)
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append(line)
+        # averages over a random mix, cache hits included: compared with the tolerance as well
+        if before.get('queries') is not None and endpoint['queries'] is not None \
+                and endpoint['queries'] > before['queries'] * (1 + tolerance):
+            line = f'{name:<16} queries {before["queries"]:.2f} -> {endpoint["queries"]:.2f}'
+            lines.append(line)
+            regressions.append(line)
+    return lines, regressions
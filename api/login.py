@@ -0,0 +1,29 @@
+"""
+Microsoft login, the only part of the API needing allauth and rest_auth's registration.
+
+Imported on the first login request (see api/urls.py), not when the workers start.
+"""
+from allauth.account.adapter import get_adapter
+from allauth.socialaccount.providers.microsoft.views import MicrosoftGraphOAuth2Adapter
+from allauth.socialaccount.providers.oauth2.client import OAuth2Client
+from rest_auth.registration.serializers import SocialLoginSerializer
+from rest_auth.views import LoginView
+
+from InnoClubs import settings
+
+
+class SocialLoginView(LoginView):
+    serializer_class = SocialLoginSerializer
+
+    def process_login(self):
+        get_adapter(self.request).login(self.request, self.user)
+
+
+class OutlookLogin(SocialLoginView):
+
+    adapter_class = MicrosoftGraphOAuth2Adapter
+
+    callback_url = settings.CALLBACK_URL
+
+    client_class = OAuth2Client
+    queryset = ''
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from api import benchmark, loadtest, views
+from api.models import Club, Membership
+
+ENDPOINTS = {
+    # name: (sync path, async path, JSON body), '{club}' is the title prefix of the seeded clubs
+    'club list': ('/api/get_clubs/?members=5', '/api/async/get_clubs/?members=5', None),
+    'club profile': ('/api/club_profile/', '/api/async/club_profile/', {'title': '{club} 0'}),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the read endpoints under WSGI and ASGI with concurrent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--clubs', type=int, default=200)
+        parser.add_argument('--prefix', default='asgi',
+                            help='Emails are <prefix>-<n>@innopolis.university, apart from those of seed_data')
+
+    def handle(self, *args, **options):
+        # the servers query from several threads, so the data is committed and deleted afterwards
+        prefix = options['prefix']
+        club = f'{prefix.capitalize()} club'  # the titles loadtest.clear() deletes
+        try:
+            users = benchmark.seed_users(20, prefix=prefix)
+            benchmark.seed_clubs(options['clubs'], users, prefix=club)
+            Membership.objects.bulk_create([Membership(club_id=pk, user_id=user.email)
+                                            for pk in Club.objects.filter(title__startswith=f'{club} ')
+                                                                  .values_list('pk', flat=True)
+                                            for user in users])
+            token = Token.objects.create(user=users[0])
+            with throttling_disabled():
+                for name, (sync_path, async_path, body) in ENDPOINTS.items():
+                    body = body and {key: value.format(club=club) for key, value in body.items()}
+                    for server, path in (('WSGI', sync_path), ('ASGI, sync view', sync_path),
+                                         ('ASGI, async view', async_path)):
+                        run = self.run_wsgi if server == 'WSGI' else self.run_asgi
+                        rate, samples = run(path, body, token.key, options['requests'], options['concurrency'])
+                        label = f'{name}, {server}'
+                        self.stdout.write(f'{benchmark.format_summary(label, benchmark.summary(samples))} '
+                                          f'{rate:.0f} req/s')
+        finally:
+            loadtest.clear(prefix)
+
+    def run_wsgi(self, path, body, key, requests, concurrency):
+        application = get_wsgi_application()
+        factory = RequestFactory()
+
+        def call(_):
+            data = json.dumps(body) if body else ''
+            environ = factory.generic('GET', path, data, content_type='application/json',
+                                      HTTP_AUTHORIZATION=f'Token {key}', HTTP_HOST='localhost').environ
+            start = time.perf_counter()
+            chunks = application(environ, lambda status, headers: None)
+            b''.join(chunks)
+            chunks.close()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        # a threaded WSGI server: one thread per concurrent connection
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(call, range(requests)))
+        return requests / (time.perf_counter() - start), samples
+
+    def run_asgi(self, path, body, key, requests, concurrency):
+        application = get_asgi_application()
+
+        async def call():
+            start = time.perf_counter()
+            await benchmark.asgi_request(application, 'GET', path, body, key)
+            return time.perf_counter() - start
+
+        async def connection(count, samples):
+            # a client connection sending its requests one after another
+            for _ in range(count):
+                samples.append(await call())
+
+        async def main():
+            samples = []
+            per_connection = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+            await asyncio.gather(*(connection(count, samples) for count in per_connection))
+            return samples
+
+        start = time.perf_counter()
+        samples = asyncio.run(main())
+        return requests / (time.perf_counter() - start), samples
+
+
+@contextmanager
+def throttling_disabled():
+    classes = [views.ListClubsView, views.RUDClubView]
+    throttles = [view.throttle_classes for view in classes]
+    for view in classes:
+        view.throttle_classes = []
+    try:
+        yield
+    finally:
+        for view, throttle_classes in zip(classes, throttles):
+            view.throttle_classes = throttle_classes
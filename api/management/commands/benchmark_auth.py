@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.authentication import TokenAuthentication, SessionAuthentication, BasicAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+
+from api import benchmark
+from api.authentication import token_cache
+
+UNCACHED_CHAIN = [TokenAuthentication, JSONWebTokenAuthentication, SessionAuthentication, BasicAuthentication]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec of token authentication with and without the token cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with benchmark.rolled_back():
+            user, = benchmark.seed_users(1)
+            token = Token.objects.create(user=user)
+            for header, label in ((f'Token {token.key}', 'valid token'), ('Token invalid', 'invalid token')):
+                for chain, name in ((UNCACHED_CHAIN, 'uncached chain'),
+                                    (api_settings.DEFAULT_AUTHENTICATION_CLASSES, 'configured chain')):
+                    token_cache.clear()
+                    rate, samples = self.run(chain, header, options['requests'])
+                    self.stdout.write(f'{benchmark.format_summary(f"{name}, {label}", benchmark.summary(samples))} '
+                                      f'{rate:.0f} req/s')
+            self.stdout.write(f'token cache: {token_cache.stats()}')
+
+    def run(self, authentication_classes, header, requests):
+        class View(APIView):
+            permission_classes = [IsAuthenticated]
+            throttle_classes = []
+
+            def get(self, request):
+                return Response({})
+
+        View.authentication_classes = authentication_classes
+        view = View.as_view()
+        factory = APIRequestFactory()
+        start = time.perf_counter()
+        samples = benchmark.measure(lambda _: view(factory.get('/', HTTP_AUTHORIZATION=header)), range(requests))
+        return requests / (time.perf_counter() - start), samples
@@ -0,0 +1,43 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api import benchmark
+from api.models import User, Club
+
+INDEXES = ['api_club_title_ci_idx', 'api_user_email_ci_idx']
+
+
+class Command(BaseCommand):
+    help = 'Measure case-insensitive club title and user email lookups with and without their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--clubs', type=int, default=10000)
+        parser.add_argument('--lookups', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with benchmark.rolled_back():
+            self.stdout.write(f'Seeding {options["users"]} users and {options["clubs"]} clubs...')
+            users = benchmark.seed_users(options['users'])
+            benchmark.seed_clubs(options['clubs'], users)
+
+            emails = [user.email.upper() for user in random.sample(users, min(options['lookups'], len(users)))]
+            titles = [f'BENCH CLUB {random.randrange(options["clubs"])}' for _ in range(options['lookups'])]
+
+            self.run('indexed', emails, titles)
+            with connection.cursor() as cursor:
+                for name in INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {name}')
+            self.run('not indexed', emails, titles)
+
+    def run(self, label, emails, titles):
+        results = {
+            f'Club title__iexact ({label})': benchmark.measure(
+                lambda title: Club.objects.filter(title__iexact=title).first(), titles),
+            f'User email__iexact ({label})': benchmark.measure(
+                lambda email: User.objects.filter(email__iexact=email).first(), emails),
+        }
+        for name, samples in results.items():
+            self.stdout.write(benchmark.format_summary(name, benchmark.summary(samples)))
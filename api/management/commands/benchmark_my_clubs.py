@@ -0,0 +1,50 @@
+import random
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import benchmark
+from api.models import Club, Membership
+from api.views import MyClubsView
+
+
+class Command(BaseCommand):
+    help = 'Measure the "my clubs" endpoints with and without their cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--clubs', type=int, default=1000)
+        parser.add_argument('--memberships', type=int, default=10, help='Clubs joined by every user')
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with benchmark.rolled_back():
+            users = benchmark.seed_users(options['users'])
+            benchmark.seed_clubs(options['clubs'], users)
+            pks = list(Club.objects.values_list('pk', flat=True))
+            Membership.objects.bulk_create([Membership(club_id=pk, user_id=user.email)
+                                            for user in users
+                                            for pk in random.sample(pks, options['memberships'])],
+                                           batch_size=5000)
+            self.stdout.write(f'{Membership.objects.count()} memberships')
+
+            sample = random.choices(users, k=options['requests'])
+            factory = APIRequestFactory()
+            for name, view in (('member', MyClubsView.as_view(throttle_classes=[])),
+                               ('head', MyClubsView.as_view(relation='clubs', throttle_classes=[]))):
+                def get(user, clear):
+                    if clear:
+                        cache.clear()
+                    request = factory.get('/')
+                    force_authenticate(request, user)
+                    return view(request).render()
+
+                self.stdout.write(benchmark.format_summary(
+                    f'my clubs ({name}, uncached)', benchmark.summary(
+                        benchmark.measure(lambda user: get(user, clear=True), sample))))
+                for user in set(sample):
+                    get(user, clear=False)
+                self.stdout.write(benchmark.format_summary(
+                    f'my clubs ({name}, cached)', benchmark.summary(
+                        benchmark.measure(lambda user: get(user, clear=False), sample))))
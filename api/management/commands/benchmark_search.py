@@ -0,0 +1,42 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from api import benchmark, fast_serializers, search
+from api.models import Club
+
+WORDS = ['chess', 'football', 'music', 'robotics', 'debate', 'photography', 'hiking', 'cinema', 'dance',
+         'volleyball', 'poetry', 'startup', 'security', 'gaming', 'theatre', 'cooking', 'anime', 'running']
+
+
+class Command(BaseCommand):
+    help = 'Measure ranked club search latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clubs', type=int, default=10000)
+        parser.add_argument('--searches', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=30)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        with benchmark.rolled_back():
+            self.stdout.write(f'Seeding {options["clubs"]} clubs...')
+            head, = benchmark.seed_users(1)
+            Club.objects.bulk_create([Club(title=f'Bench club {i} {random.choice(WORDS)}',
+                                           description=' '.join(random.choices(WORDS, k=8)),
+                                           head_of_the_club=head)
+                                      for i in range(options['clubs'])], batch_size=1000)
+            # bulk_create does not send post_save
+            search.index_clubs(Club.objects.values_list('pk', flat=True))
+
+            size = options['page_size']
+            queries = {
+                'one word': [random.choice(WORDS) for _ in range(options['searches'])],
+                'two words': [' '.join(random.sample(WORDS, 2)) for _ in range(options['searches'])],
+                'prefix': [random.choice(WORDS)[:3] for _ in range(options['searches'])],
+            }
+            for name, terms in queries.items():
+                samples = benchmark.measure(lambda query: fast_serializers.serialize_clubs(
+                    fast_serializers.club_rows(search.search_clubs(query).order_by('-rank', 'id'))[:size],
+                    members_limit=0), terms)
+                self.stdout.write(benchmark.format_summary(f'search, {name}', benchmark.summary(samples)))
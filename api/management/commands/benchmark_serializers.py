@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import benchmark, fast_serializers
+from api.models import Club, Membership
+from api.serializers import ListClubsSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-club serialization cost of ListClubsSerializer and the fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clubs', type=int, default=500)
+        parser.add_argument('--members', type=int, default=50, help='Members per club')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        clubs, repeat = options['clubs'], options['repeat']
+        with benchmark.rolled_back():
+            users = benchmark.seed_users(options['members'])
+            benchmark.seed_clubs(clubs, users)
+            Membership.objects.bulk_create([Membership(club_id=pk, user_id=user.email)
+                                            for pk in Club.objects.values_list('pk', flat=True)
+                                            for user in users], batch_size=5000)
+
+            # serialization only, the data is loaded beforehand
+            instances = list(Club.objects.with_members().order_by('id'))
+            rows = list(fast_serializers.club_rows(Club.objects.order_by('id')))
+            members = fast_serializers.fetch_members([row['id'] for row in rows])
+            self.report('ListClubsSerializer', clubs, repeat,
+                        lambda: ListClubsSerializer(instances, many=True).data)
+            self.report('fast path', clubs, repeat,
+                        lambda: fast_serializers.build_clubs(rows, members))
+
+            # queries included
+            self.report('ListClubsSerializer + queries', clubs, repeat,
+                        lambda: ListClubsSerializer(Club.objects.with_members().order_by('id'), many=True).data)
+            self.report('fast path + queries', clubs, repeat,
+                        lambda: fast_serializers.serialize_clubs(
+                            fast_serializers.club_rows(Club.objects.order_by('id'))))
+
+    def report(self, name, clubs, repeat, serialize):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            samples.append(time.perf_counter() - start)
+        per_club = min(samples) / clubs * 1e6
+        self.stdout.write(f'{name:<32} {per_club:8.1f} us/club (best of {repeat})')
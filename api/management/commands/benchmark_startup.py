@@ -0,0 +1,81 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = {'full': '0', 'api-only': '1'}  # profile: API_ONLY
+
+# what a worker does before serving: load the application, then the URLconf on the first request.
+# RSS is read from /proc, the peak of getrusage() is inherited from the forking process on Linux.
+WORKER = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from InnoClubs.{server} import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - start
+try:
+    with open('/proc/self/status') as status:
+        rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': seconds, 'rss': rss, 'modules': sorted(sys.modules)}}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Compare the startup time, import time (-X importtime) and memory of a worker per settings profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument('--top', type=int, default=10, help='packages listed by import time')
+
+    def handle(self, *args, **options):
+        results = {}
+        for profile, api_only in PROFILES.items():
+            runs = [self.start_worker(options['server'], api_only) for _ in range(options['runs'])]
+            # best of the runs for times, as timeit does, the rest is noise of the machine
+            fastest = min(runs, key=lambda run: sum(run['imports'].values()))
+            results[profile] = result = {
+                'seconds': min(run['seconds'] for run in runs),
+                'imports': sum(fastest['imports'].values()),
+                'rss': statistics.median(run['rss'] for run in runs),
+                'modules': runs[0]['modules'],
+                'packages': fastest['imports'],  # microseconds of import time (self) per top-level package
+            }
+            self.stdout.write(f'{profile:<10} ready={result["seconds"] * 1000:.0f}ms '
+                              f'imports={result["imports"] / 1000:.0f}ms rss={result["rss"] / 1024:.1f}MB '
+                              f'modules={len(result["modules"])}')
+
+        for profile, result in results.items():
+            slowest = Counter(result['packages']).most_common(options['top'])
+            self.stdout.write(f'slowest imports, {profile}: ' +
+                              ', '.join(f'{package} {us / 1000:.0f}ms' for package, us in slowest))
+        full_only = Counter(module.partition('.')[0] for module in results['full']['modules']
+                            if module not in set(results['api-only']['modules']))
+        self.stdout.write('only loaded by the full profile: ' +
+                          ', '.join(f'{package} ({count})' for package, count in full_only.most_common()))
+
+    def start_worker(self, server, api_only):
+        # the settings are read from the environment, a fresh interpreter per profile and run
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', WORKER.format(server=server)],
+                                 cwd=settings.BASE_DIR, env=dict(os.environ, API_ONLY=api_only),
+                                 capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(process.stderr.splitlines()[-1] if process.stderr else 'the worker failed')
+        imports = Counter()
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if line.startswith('import time:') and '|' in line:
+                own, _, package = line[len('import time:'):].split('|')
+                if own.strip().isdigit():
+                    imports[package.strip().partition('.')[0]] += int(own)
+        result = json.loads(process.stdout.splitlines()[-1])
+        result['imports'] = imports
+        return result
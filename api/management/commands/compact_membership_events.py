@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import MembershipEvent
+
+
+class Command(BaseCommand):
+    help = 'Compact membership events older than --days: keep the latest event of every user in every club'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete the old events instead of keeping the latest ones')
+
+    def handle(self, *args, **options):
+        old = MembershipEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=options['days']))
+        if not options['purge']:
+            latest = old.order_by().values('club_id', 'user_email').annotate(latest=Max('id')).values('latest')
+            old = old.exclude(id__in=latest)
+        deleted, _ = old.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} event(s)'))
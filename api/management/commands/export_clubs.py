@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api import transfer
+
+
+class Command(BaseCommand):
+    help = 'Export clubs, their heads and members as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file, stdout by default')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='File format, guessed from the extension by default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        chunks = transfer.render_records(transfer.export_records(),
+                                         options['format'] or transfer.guess_format(path or ''))
+        if not path:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            file.writelines(chunks)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api import transfer
+
+
+class Command(BaseCommand):
+    help = 'Import clubs, their heads and members from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        format = options['format'] or transfer.guess_format(options['path'])
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            try:
+                imported = transfer.import_records(transfer.read_records(file, format),
+                                                   batch_size=options['batch_size'])
+            except ValidationError as error:
+                raise CommandError(error.detail[0])
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} club record(s)'))
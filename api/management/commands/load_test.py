@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmark, loadtest
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of user flows against the API and report latency, throughput and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transport', choices=['wsgi', 'asgi', 'http'], default='wsgi',
+                            help='wsgi / asgi: the application in-process, http: a server at --url')
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8, help='Virtual users, one thread each')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--duration', type=float, help='Seconds to run for, instead of --requests')
+        parser.add_argument('--prefix', default='load', help='Prefix of the users seeded with seed_data')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare with the results in this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Relative change of a latency percentile or requests/sec counted as a regression')
+
+    def handle(self, *args, **options):
+        try:
+            users = loadtest.virtual_users(options['concurrency'], options['seed'], options['prefix'])
+        except ValueError as error:
+            raise CommandError(f'{error}, run seed_data first')
+        requests = None if options['duration'] else options['requests']
+
+        if options['transport'] == 'http':
+            samples, seconds = loadtest.run(loadtest.HTTPTransport(options['url']), users,
+                                            requests, options['duration'])
+        else:
+            with loadtest.in_process():
+                transport = loadtest.WSGITransport() if options['transport'] == 'wsgi' else loadtest.ASGITransport()
+                try:
+                    samples, seconds = loadtest.run(transport, users, requests, options['duration'])
+                finally:
+                    transport.close()
+
+        results = loadtest.report(samples, seconds)
+        results['config'] = {key: options[key] for key in ('transport', 'concurrency', 'requests', 'duration',
+                                                            'prefix', 'seed')}
+        for name, endpoint in results['endpoints'].items():
+            queries = '-' if endpoint['queries'] is None else f'{endpoint["queries"]:.1f}'
+            self.stdout.write(f'{benchmark.format_summary(name, endpoint)} {endpoint["rps"]:8.1f} req/s '
+                              f'{queries:>5} queries/req {endpoint["errors"]} errors')
+        self.stdout.write(f'total: {results["requests"]} requests in {results["seconds"]:.2f}s, '
+                          f'{results["rps"]:.1f} req/s, {results["errors"]} errors')
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                lines, regressions = loadtest.compare(results, json.load(file), options['tolerance'])
+            self.stdout.write('\n'.join(['compared with the baseline:', *lines]))
+            if regressions:
+                raise CommandError('regressions beyond the tolerance:\n' + '\n'.join(regressions))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from api import caching
+from api.models import Club, Membership
+
+
+class Command(BaseCommand):
+    help = 'Recompute Club.member_count from the members table and repair drifted rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drifted clubs, do not change them')
+
+    def handle(self, *args, **options):
+        drifted = Club.objects.annotate(actual=Count('members')) \
+                              .exclude(member_count=F('actual')) \
+                              .values_list('pk', 'title', 'member_count', 'actual')
+
+        repaired = 0
+        for pk, title, stored, actual in list(drifted):
+            self.stdout.write(f'{title}: member_count={stored}, actual={actual}')
+            if options['dry_run']:
+                continue
+            with transaction.atomic():
+                # recount under the row lock, the membership may have changed meanwhile
+                Club.objects.select_for_update().filter(pk=pk).first()
+                actual = Membership.objects.filter(club_id=pk).count()
+                Club.objects.filter(pk=pk).update(member_count=actual, version=F('version') + 1,
+                                                  updated_at=timezone.now())
+                caching.invalidate_clubs(pk)
+                caching.invalidate_member_lists(pk)
+            repaired += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} club(s)'))
@@ -0,0 +1,27 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import loadtest
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic users (with tokens), clubs and memberships for load testing, or remove them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--clubs', type=int, default=100)
+        parser.add_argument('--memberships', type=int, default=5, help='Random clubs joined by every user')
+        parser.add_argument('--prefix', default='load', help='Emails are <prefix>-<n>@innopolis.university')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help='Only remove previously seeded data')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            loadtest.clear(options['prefix'])
+            if options['clear']:
+                return
+            users, clubs = loadtest.seed(options['users'], options['clubs'], options['memberships'],
+                                         random.Random(options['seed']), options['prefix'])
+        self.stdout.write(f'Seeded {len(users)} users and {len(clubs)} clubs')
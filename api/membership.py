@@ -0,0 +1,77 @@
+"""
+Race-free joins and leaves.
+
+Every change is a single statement on the members table: joins insert with
+ON CONFLICT DO NOTHING (INSERT OR IGNORE on SQLite), leaves delete. Of concurrent
+identical requests (double taps, retries) exactly one changes the membership, and
+only the clubs it actually changed get their counters moved and events written,
+in the same transaction. The others succeed without changing anything.
+"""
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Club, Membership, MembershipEvent
+
+
+def _insert_sql(connection, user_pk, club_ids):
+    ops = connection.ops
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(club_ids))
+    sql = f'{ops.insert_statement(ignore_conflicts=True)} {ops.quote_name(Membership._meta.db_table)} ' \
+          f'(club_id, user_id, joined_at, role) VALUES {values} {ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    joined_at = ops.adapt_datetimefield_value(timezone.now())
+    return sql, [value for pk in club_ids for value in (pk, user_pk, joined_at, Membership.MEMBER)]
+
+
+def _delete_sql(connection, user_pk, club_ids):
+    sql = f'DELETE FROM {connection.ops.quote_name(Membership._meta.db_table)} ' \
+          f'WHERE user_id = %s AND club_id IN ({", ".join(["%s"] * len(club_ids))})'
+    return sql, [user_pk, *club_ids]
+
+
+def _execute(connection, statement, user_pk, club_ids):
+    """
+    Run the statement for `club_ids`, return the ids of the clubs whose row it changed.
+    """
+    with connection.cursor() as cursor:
+        # RETURNING lists the changed rows at once: PostgreSQL, SQLite 3.35+
+        if connection.vendor == 'postgresql' or \
+                (connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)):
+            sql, params = statement(connection, user_pk, club_ids)
+            cursor.execute(f'{sql} RETURNING club_id', params)
+            return [club_id for club_id, in cursor.fetchall()]
+        changed = []
+        for pk in club_ids:
+            cursor.execute(*statement(connection, user_pk, [pk]))
+            if cursor.rowcount:
+                changed.append(pk)
+        return changed
+
+
+def _apply(statement, delta, kind, user_pk, clubs):
+    clubs = {club.pk: club for club in clubs}
+    if not clubs:
+        return []
+    using = router.db_for_write(Membership)
+    with transaction.atomic(using=using):
+        changed = _execute(connections[using], statement, user_pk, list(clubs))
+        if changed:
+            Club.objects.filter(pk__in=changed).update_membership(delta)
+            MembershipEvent.record(kind, [(clubs[pk], user_pk) for pk in changed])
+            caching.invalidate_clubs(*changed)
+            caching.invalidate_user_lists(user_pk)
+    return [clubs[pk] for pk in changed]
+
+
+def join(user_pk, clubs):
+    """
+    Add the user to `clubs`, return the clubs the user was not a member of.
+    """
+    return _apply(_insert_sql, +1, MembershipEvent.JOINED, user_pk, clubs)
+
+
+def leave(user_pk, clubs):
+    """
+    Remove the user from `clubs`, return the clubs the user was a member of.
+    """
+    return _apply(_delete_sql, -1, MembershipEvent.LEFT, user_pk, clubs)
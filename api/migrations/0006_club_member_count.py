@@ -0,0 +1,30 @@
+# Generated by Django 3.1.1 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+def count_members(apps, schema_editor):
+    Club = apps.get_model('api', 'Club')
+    for club in Club.objects.annotate(count=models.Count('members')).only('id').iterator():
+        Club.objects.filter(pk=club.pk).update(member_count=club.count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_auto_20200929_2243'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='club',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='club',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_members, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+import api.models
+from django.db import migrations
+
+# `title__iexact` / `email__iexact` compile to UPPER("column"::text) = UPPER(%s) on PostgreSQL
+# and to "column" LIKE %s ESCAPE '\' on SQLite, CaseInsensitiveIndex creates the matching
+# expression indexes. Declared on the models, so Django keeps them through table rebuilds.
+# MySQL compares with case-insensitive collations and gets plain indexes.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_club_member_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='club',
+            index=api.models.CaseInsensitiveIndex(fields=['title'], name='api_club_title_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=api.models.CaseInsensitiveIndex(fields=['email'], name='api_user_email_ci_idx'),
+        ),
+    ]
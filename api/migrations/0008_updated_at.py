@@ -0,0 +1,23 @@
+# Generated by Django 3.1.1 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_case_insensitive_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='club',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# See api/search.py. Generated columns need PostgreSQL 12+, FTS5 is built into
+# the SQLite shipped with Python. Other databases search with icontains.
+SQL = {
+    'postgresql': [
+        "ALTER TABLE api_club ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+        'CREATE INDEX api_club_search_vector_idx ON api_club USING GIN (search_vector)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE api_club_search USING fts5(title, description)',
+        'INSERT INTO api_club_search (rowid, title, description) SELECT id, title, description FROM api_club',
+    ],
+}
+REVERSE_SQL = {
+    'postgresql': ['ALTER TABLE api_club DROP COLUMN search_vector'],
+    'sqlite': ['DROP TABLE api_club_search'],
+}
+
+
+def create_search(apps, schema_editor):
+    for sql in SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search(apps, schema_editor):
+    for sql in REVERSE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
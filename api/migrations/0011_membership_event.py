@@ -0,0 +1,37 @@
+# Generated by Django 3.1.1 on 2026-10-18 07:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_club_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'joined'), (2, 'left'), (3, 'head_changed'), (4, 'created'), (5, 'deleted')])),
+                ('club_id', models.IntegerField()),
+                ('club_title', models.CharField(max_length=100)),
+                ('user_email', models.EmailField(max_length=254)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='membershipevent',
+            index=models.Index(fields=['club_id', 'id'], name='api_event_club_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipevent',
+            index=models.Index(fields=['user_email', 'id'], name='api_event_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipevent',
+            index=models.Index(fields=['created_at'], name='api_event_created_idx'),
+        ),
+    ]
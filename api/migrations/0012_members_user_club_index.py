@@ -0,0 +1,19 @@
+from django.db import migrations
+
+# "Clubs of user X" reads (user_id, club_id) pairs of the implicit members table.
+# The unique (club_id, user_id) index leads with the club, the single-column user_id
+# index needs a table lookup per row; this one answers the join from the index alone.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_membership_event'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX api_club_members_user_club_idx ON api_club_members (user_id, club_id)',
+            'DROP INDEX api_club_members_user_club_idx',
+        ),
+    ]
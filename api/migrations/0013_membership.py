@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+import django.utils.timezone
+
+JOINED, CREATED = 1, 4  # MembershipEvent kinds, heads join their club on creation
+
+
+def backfill_joined_at(apps, schema_editor):
+    # memberships older than the event log keep the time of this migration
+    Membership = apps.get_model('api', 'Membership')
+    MembershipEvent = apps.get_model('api', 'MembershipEvent')
+    joined = MembershipEvent.objects.filter(kind__in=[JOINED, CREATED],
+                                            club_id=models.OuterRef('club_id'),
+                                            user_email=models.OuterRef('user_id'))
+    Membership.objects.update(
+        joined_at=Coalesce(models.Subquery(joined.order_by('-id').values('created_at')[:1]), 'joined_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_members_user_club_index'),
+    ]
+
+    operations = [
+        # the implicit through table of Club.members becomes the Membership model as it is,
+        # with its rows, its unique (club_id, user_id) index and the index of 0012
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Membership',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.club')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'api_club_members',
+                        'unique_together': {('club', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='club',
+                    name='members',
+                    field=models.ManyToManyField(through='api.Membership', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AddIndex(
+                    model_name='membership',
+                    index=models.Index(fields=['user', 'club'], name='api_club_members_user_club_idx'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='joined_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='role',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'member'), (2, 'moderator')], default=1),
+        ),
+        migrations.RunPython(backfill_joined_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['club', 'joined_at'], name='api_member_club_joined_idx'),
+        ),
+    ]
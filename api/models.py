@@ -1,10 +1,32 @@
 from django.db import models
+from django.db.backends.ddl_references import Statement, Table
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+class CaseInsensitiveIndex(models.Index):
+
+    """
+    Single-column index matching the SQL Django emits for `__iexact` lookups:
+    UPPER("column"::text) on PostgreSQL, "column" COLLATE NOCASE (used by LIKE) on SQLite,
+    a plain index elsewhere. Expression indexes in Meta.indexes need Django 3.2+.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        column = schema_editor.quote_name(model._meta.get_field(self.fields[0]).column)
+        expression = {
+            'postgresql': f'UPPER({column}::text)',
+            'sqlite': f'{column} COLLATE NOCASE',
+        }.get(schema_editor.connection.vendor, column)
+        return Statement('CREATE INDEX %(name)s ON %(table)s (%(expression)s)',
+                         name=schema_editor.quote_name(self.name),
+                         table=Table(model._meta.db_table, schema_editor.quote_name),
+                         expression=expression)
+
+
 class User(AbstractUser):
 
     """
@@ -27,11 +49,47 @@ class User(AbstractUser):
     telegram_alias = models.CharField(max_length=100, blank=True)
     status = models.IntegerField(default=1, validators=[MinValueValidator(1),
                                                         MaxValueValidator(2)])
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [CaseInsensitiveIndex(fields=['email'], name='api_user_email_ci_idx')]
 
     def __str__(self):
         return f'{self.email} Profile'
 
 
+class ClubQuerySet(models.QuerySet):
+
+    # User columns embedded into club payloads (see RUDUserInfoSerializer)
+    USER_FIELDS = ('email', 'first_name', 'last_name', 'telegram_alias')
+
+    def with_head(self):
+        """
+        Load clubs together with their head in a single query,
+        fetching only the columns the serializers need.
+        """
+        head_fields = [f'head_of_the_club__{field}' for field in self.USER_FIELDS]
+        return self.select_related('head_of_the_club') \
+                   .only('title', 'description', 'member_count', 'head_of_the_club', *head_fields)
+
+    def with_members(self):
+        """
+        Load clubs together with their head and members (ordered by email) using
+        a fixed number of queries (one for clubs and heads, one for all members).
+        """
+        members = User.objects.only(*self.USER_FIELDS).order_by('email')
+        return self.with_head().prefetch_related(models.Prefetch('members', queryset=members))
+
+    def update_membership(self, delta):
+        """
+        Atomically shift `member_count` by `delta`, bump `version` and `updated_at`.
+        Has to be called in the same transaction as the membership change.
+        """
+        return self.update(member_count=models.F('member_count') + delta,
+                           version=models.F('version') + 1,
+                           updated_at=timezone.now())
+
+
 class Club(models.Model):
 
     title = models.CharField(max_length=100, blank=False, unique=True)
@@ -40,7 +98,93 @@ class Club(models.Model):
                                          on_delete=models.CASCADE,
                                          blank=False,
                                          related_name='clubs')  # how to call Club model from User model
-    members = models.ManyToManyField(User)
+    members = models.ManyToManyField(User, through='Membership')
+
+    # Denormalized from `members`, maintained by serializers with F() expressions,
+    # `python manage.py repair_member_counts` fixes any drift
+    member_count = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)  # incremented on every membership change
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ClubQuerySet.as_manager()
+
+    class Meta:
+        indexes = [CaseInsensitiveIndex(fields=['title'], name='api_club_title_ci_idx')]
 
     def __str__(self):
         return f'{self.title}'
+
+    def track_membership(self, delta):
+        Club.objects.filter(pk=self.pk).update_membership(delta)
+
+
+class Membership(models.Model):
+
+    """
+    Through model of Club.members, on the table of the former implicit one.
+
+    Roles:
+        1 - member
+        2 - moderator
+    """
+
+    MEMBER, MODERATOR = 1, 2
+    ROLES = [(MEMBER, 'member'), (MODERATOR, 'moderator')]
+
+    club = models.ForeignKey(Club, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    joined_at = models.DateTimeField(default=timezone.now)
+    role = models.PositiveSmallIntegerField(choices=ROLES, default=MEMBER)
+
+    class Meta:
+        db_table = 'api_club_members'
+        unique_together = [('club', 'user')]
+        indexes = [models.Index(fields=['club', 'joined_at'], name='api_member_club_joined_idx'),
+                   models.Index(fields=['user', 'club'], name='api_club_members_user_club_idx')]
+
+    def __str__(self):
+        return f'{self.user_id} {self.get_role_display()} of {self.club_id}'
+
+
+class MembershipEvent(models.Model):
+
+    """
+    Append-only log of membership changes, written in the transaction of the change.
+    There are no foreign keys: events outlive deleted clubs and users.
+    `python manage.py compact_membership_events` compacts old events.
+
+    Kinds:
+        1 - user joined the club
+        2 - user left the club
+        3 - user became the head of the club
+        4 - club created by user (its head)
+        5 - club deleted (user - its head)
+    """
+
+    JOINED, LEFT, HEAD_CHANGED, CREATED, DELETED = 1, 2, 3, 4, 5
+    KINDS = [(JOINED, 'joined'), (LEFT, 'left'), (HEAD_CHANGED, 'head_changed'),
+             (CREATED, 'created'), (DELETED, 'deleted')]
+
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    club_id = models.IntegerField()
+    club_title = models.CharField(max_length=100)  # at the time of the event
+    user_email = models.EmailField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['club_id', 'id'], name='api_event_club_idx'),
+                   models.Index(fields=['user_email', 'id'], name='api_event_user_idx'),
+                   models.Index(fields=['created_at'], name='api_event_created_idx')]
+
+    def __str__(self):
+        return f'{self.user_email} {self.get_kind_display()} {self.club_title}'
+
+    @classmethod
+    def record(cls, kind, pairs):
+        """
+        Append `kind` events for (club, user email) pairs.
+        """
+        now = timezone.now()
+        return cls.objects.bulk_create([cls(kind=kind, club_id=club.pk, club_title=club.title,
+                                            user_email=email, created_at=now)
+                                        for club, email in pairs])
@@ -1,18 +1,18 @@
 from rest_framework import permissions
 from rest_framework import exceptions
-from .models import User, Club
+from .resolvers import resolve_club, resolve_user
 
 
 class IsValidEmail(permissions.DjangoModelPermissions):
     def has_permission(self, request, view):
-        if not User.objects.filter(email__iexact=request.data.get('email', None)).count():
+        if resolve_user(request) is None:
             raise exceptions.APIException('Invalid email')
         return True
 
 
 class IsValidTitle(permissions.DjangoModelPermissions):
     def has_permission(self, request, view):
-        if not Club.objects.filter(title__iexact=request.data.get('title', None)).count():
+        if resolve_club(request) is None:
             raise exceptions.APIException('Invalid title')
         return True
 
@@ -51,3 +51,12 @@ class IsAdmin(permissions.BasePermission):
 
     def has_permission(self, request, view):
         return request.user.status == 2
+
+
+class IsClubHeadOrAdmin(permissions.BasePermission):
+    """
+    Object-level permission for club data only its head (or an admin) may read.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        return obj.head_of_the_club_id == request.user.pk or request.user.status == 2
@@ -0,0 +1,187 @@
+"""
+Per-request detection of query budget overruns, N+1 patterns and slow queries.
+
+Executed SQL is grouped by its normalized template (literals, placeholders and
+IN / VALUES lists folded), so one query run per row of a result shows up as a
+template repeated QUERY_REPEAT_LIMIT or more times. Queries slower than
+QUERY_SLOW_MS are reported as well, and so are requests running more queries
+than their view declares:
+
+    class JoinClubView(...):
+        query_budget = 5                      # every method
+        query_budget = {'GET': 2, 'PUT': 5}   # per method, others unchecked
+
+Budgets are for requests authenticated from the token cache, a cache miss adds its
+lookup. Transaction statements (savepoints) do not count. Every problem is logged to the
+`api.queries` logger with the line of project code that ran the query.
+
+QUERY_INSPECTOR selects the mode: 'off' (default, nothing is installed), 'log', or
+'raise', which makes the request fail with QueryBudgetExceeded instead of logging. The test suite runs
+in 'raise' mode, so a regression fails the test that made the request. Queries of
+streamed responses run after the middleware returns and are not seen.
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import instrumentation
+from .utils import AsyncCapableMiddleware
+
+logger = logging.getLogger('api.queries')
+
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRAPPER_FILES = (__file__, instrumentation.__file__)  # execute wrappers, not the origin of a query
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_lists = re.compile(r'\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def normalize(sql):
+    """
+    Template of a statement: literals and placeholders become `?`, lists of them `(...)`.
+    """
+    sql = _literals.sub('?', ' '.join(sql.split()))
+    return _lists.sub('(...)', sql)
+
+
+def origin():
+    """
+    The innermost frame of project code (execute wrappers aside) on the stack, as 'path:line in function'.
+    """
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename.startswith(PROJECT_DIR) and frame.filename not in WRAPPER_FILES \
+                and f'{os.sep}site-packages{os.sep}' not in frame.filename:
+            return f'{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+recorders = ContextVar('query_recorders', default=())
+
+
+def record_query(execute, sql, params, many, context):
+    active = recorders.get()
+    if not active:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        template = normalize(sql)
+        if not template.startswith(TRANSACTION_STATEMENTS):
+            query = (template, time.perf_counter() - start, origin())
+            for recorder in active:
+                recorder.queries.append(query)
+
+
+def add_execute_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_installed = False
+
+
+def install():
+    """
+    Add the recording execute wrapper to every database connection, once per process.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(add_execute_wrapper)
+    for connection in connections.all():  # opened before, in this thread
+        add_execute_wrapper(None, connection)
+
+
+class QueryRecorder:
+
+    """
+    Records (template, duration, origin) of the queries run in the current context while
+    entered, on every database connection. Recorders are kept in a context variable, so
+    the queries of sync views run by an async stack and of the async views' database pool,
+    which run in copies of the context, are recorded too. Recorders nest.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._token = None
+
+    def __enter__(self):
+        install()
+        self._token = recorders.set(recorders.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        recorders.reset(self._token)
+
+    def problems(self, budget=None, repeat_limit=None, slow_ms=None):
+        """
+        Descriptions of the budget overrun, repeated templates and slow queries.
+        """
+        problems = []
+        if budget is not None and len(self.queries) > budget:
+            problems.append(f'{len(self.queries)} queries, the budget is {budget}:\n' +
+                            '\n'.join(f'    {template} ({where})' for template, _, where in self.queries))
+        if repeat_limit:
+            counts = Counter(template for template, _, _ in self.queries)
+            origins = {template: where for template, _, where in reversed(self.queries)}
+            problems += [f'N+1: {count} x {template} ({origins[template]})'
+                         for template, count in counts.items() if count >= repeat_limit]
+        if slow_ms is not None:
+            problems += [f'slow query: {duration * 1000:.1f}ms {template} ({where})'
+                         for template, duration, where in self.queries if duration * 1000 > slow_ms]
+        return problems
+
+
+def query_budget(request):
+    """
+    The query budget declared by the view handling the request, or None.
+    """
+    match = request.resolver_match
+    view = match and (getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None))
+    budget = getattr(view, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(request.method)
+    return budget
+
+
+class QueryInspectorMiddleware(AsyncCapableMiddleware):
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install()
+
+    def call(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def acall(self, request):
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    @staticmethod
+    def check(request, recorder):
+        problems = recorder.problems(query_budget(request), settings.QUERY_REPEAT_LIMIT, settings.QUERY_SLOW_MS)
+        if problems:
+            report = f'{request.method} {request.path}: ' + '\n'.join(problems)
+            if settings.QUERY_INSPECTOR == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
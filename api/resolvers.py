@@ -0,0 +1,39 @@
+"""
+Request-scoped resolution of the club / user addressed by a request.
+
+Permissions, views and serializers of one request all need the same object,
+so it is looked up once and kept on the request.
+"""
+from .models import User, Club
+
+
+def _resolve(request, kind, value, lookup):
+    key = (kind, None if value is None else str(value).upper())
+    try:
+        resolved = request._resolved_objects
+    except AttributeError:
+        resolved = request._resolved_objects = {}
+    if key not in resolved:
+        resolved[key] = lookup()
+    return resolved[key]
+
+
+def resolve_club(request, title=None):
+    """
+    Club with the given title (request.data['title'] by default), case-insensitively, or None.
+    """
+    if title is None:
+        title = request.data.get('title', None)
+    return _resolve(request, 'club', title,
+                    lambda: Club.objects.select_related('head_of_the_club')
+                                        .filter(title__iexact=title).first())
+
+
+def resolve_user(request, email=None):
+    """
+    User with the given email (request.data['email'] by default), case-insensitively, or None.
+    """
+    if email is None:
+        email = request.data.get('email', None)
+    return _resolve(request, 'user', email,
+                    lambda: User.objects.filter(email__iexact=email).first())
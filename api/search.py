@@ -0,0 +1,77 @@
+"""
+Full-text search over club titles and descriptions.
+
+PostgreSQL - `api_club.search_vector`, a generated tsvector column (titles weigh more
+than descriptions) with a GIN index, see migration 0010. It is not part of the model.
+SQLite - the `api_club_search` FTS5 table, rowid = club id. Signals keep it in step with
+saved / deleted clubs, code writing clubs in bulk has to call `index_clubs()` itself.
+Other databases fall back to `icontains` without ranking.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Club
+
+FTS_TABLE = 'api_club_search'
+WORD = re.compile(r'\w+')
+
+
+def terms(query):
+    return WORD.findall(query.lower())
+
+
+def search_clubs(query, queryset=None):
+    """
+    Clubs matching every word of `query`, annotated with `rank` (higher is better).
+    """
+    queryset = Club.objects.all() if queryset is None else queryset
+    words = terms(query)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        tsquery = "to_tsquery('english', %s)"
+        # every word as a prefix, so results show up while the query is being typed
+        expression = ' & '.join(f'{word}:*' for word in words)
+        return queryset.annotate(rank=RawSQL(f'ts_rank(api_club.search_vector, {tsquery})', [expression],
+                                             output_field=FloatField())) \
+                       .extra(where=[f'api_club.search_vector @@ {tsquery}'], params=[expression])
+    if connection.vendor == 'sqlite':
+        expression = ' '.join(f'"{word}"*' for word in words)
+        # joined rather than a subquery, so bm25() is computed once per match;
+        # it is lower for better matches, column weights: title 10, description 1
+        return queryset.extra(select={'rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+                              tables=[FTS_TABLE],
+                              where=[f'{FTS_TABLE}.rowid = api_club.id', f'{FTS_TABLE} MATCH %s'],
+                              params=[expression])
+    condition = Q()
+    for word in words:
+        condition &= Q(title__icontains=word) | Q(description__icontains=word)
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def index_clubs(pks):
+    """
+    Refresh the search entries of the given clubs (SQLite only).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), 500):
+            batch = pks[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description) '
+                           f'SELECT id, title, description FROM api_club WHERE id IN ({placeholders})', batch)
+
+
+def unindex_clubs(pks):
+    if connection.vendor != 'sqlite':
+        return
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), 500):
+            batch = pks[start:start + 500]
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
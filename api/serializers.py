@@ -1,7 +1,24 @@
+from django.db import transaction
+from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from .models import User, Club
+from . import membership
+from .models import User, Club, Membership, MembershipEvent
+from .resolvers import resolve_club, resolve_user
+
+
+def check_can_join(is_member):
+    if is_member:
+        raise serializers.ValidationError('You have already joined this club')
+
+
+def check_can_leave(club, user, is_member):
+    if not is_member:
+        raise serializers.ValidationError('You are not a member of the club')
+    if club.head_of_the_club_id == user.pk:
+        raise serializers.ValidationError('You can not leave a club, as you are a head of this club. ' +
+                                          'Please delegate your job to another one')
 
 
 class RUDUserInfoSerializer(serializers.ModelSerializer):
@@ -22,10 +39,26 @@ class RUDUserInfoSerializer(serializers.ModelSerializer):
         instance.first_name = validated_data['first_name']
         instance.last_name = validated_data['last_name']
         instance.telegram_alias = validated_data['telegram_alias']
-        instance.save()
+        instance.save(update_fields=['first_name', 'last_name', 'telegram_alias', 'updated_at'])
         return instance
 
 
+class ClubMemberSerializer(RUDUserInfoSerializer):
+
+    """
+    Member of a club, users annotated with `joined_at` and `role` of their Membership.
+    """
+
+    joined_at = serializers.DateTimeField(read_only=True)
+    role = serializers.SerializerMethodField()
+
+    class Meta(RUDUserInfoSerializer.Meta):
+        fields = RUDUserInfoSerializer.Meta.fields + ['joined_at', 'role']
+
+    def get_role(self, user):
+        return dict(Membership.ROLES)[user.role]
+
+
 class CreateClubSerializer(serializers.ModelSerializer):
     title = serializers.CharField(max_length=100, allow_blank=False)
     description = serializers.CharField(allow_blank=True)
@@ -45,8 +78,11 @@ class CreateClubSerializer(serializers.ModelSerializer):
         club = Club(title=validated_data['title'],
                     description=validated_data['description'],
                     head_of_the_club=user)
-        club.save()
-        club.members.add(user)
+        with transaction.atomic():
+            club.save()
+            club.members.add(user)
+            club.track_membership(+1)
+            MembershipEvent.record(MembershipEvent.CREATED, [(club, user.pk)])
         return club
 
 
@@ -56,6 +92,7 @@ class RetrieveClubsSerializer(serializers.Serializer):
     description = serializers.CharField(allow_blank=True, required=False)
     head_of_the_club = RUDUserInfoSerializer(required=False, read_only=True)
     members = RUDUserInfoSerializer(many=True, required=False, read_only=True)
+    member_count = serializers.IntegerField(read_only=True)
 
     new_title = serializers.CharField(allow_blank=False,
                                       max_length=100,
@@ -66,19 +103,46 @@ class RetrieveClubsSerializer(serializers.Serializer):
         pass
 
     def validate_new_title(self, value):
-        obj = Club.objects.filter(title__iexact=value)
-        obj = obj.exclude(title__iexact=self.instance.title)
-        if obj.count():
+        obj = Club.objects.filter(title__iexact=value).exclude(pk=self.instance.pk)
+        if obj.exists():
             raise serializers.ValidationError('There is already a club with such title')
         return value
 
     def update(self, instance, validated_data):
         instance.title = validated_data['new_title']
         instance.description = validated_data['new_description']
-        instance.save()
+        instance.save(update_fields=['title', 'description', 'updated_at'])
         return instance
 
 
+class ListClubsSerializer(RetrieveClubsSerializer):
+
+    """
+    Read-only club representation for listings.
+
+    `members_limit` in the context controls member embedding:
+        - None - embed every member (same output as RetrieveClubsSerializer)
+        - 0 - do not embed members
+        - K - embed the first K members
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        limit = self.context.get('members_limit')
+        if limit == 0:
+            del fields['members']
+        elif limit:
+            fields['members'] = RUDUserInfoSerializer(many=True, read_only=True, source='members_page')
+        return fields
+
+    def to_representation(self, instance):
+        limit = self.context.get('members_limit')
+        if limit:
+            # slice the prefetched members, slicing the related manager would hit the database
+            instance.members_page = list(instance.members.all())[:limit]
+        return super().to_representation(instance)
+
+
 class JoinClubSerializer(serializers.ModelSerializer):
     title = serializers.CharField(max_length=100, allow_blank=False)
 
@@ -87,21 +151,19 @@ class JoinClubSerializer(serializers.ModelSerializer):
         fields = ['title']
 
     def validate_title(self, value):
-        if not Club.objects.filter(title__iexact=value).count():
+        if resolve_club(self.context['request'], value) is None:
             raise serializers.ValidationError('Club title is incorrect')
         return value
 
     def validate(self, attrs):
-        user = self.context['request'].user
-        club = Club.objects.filter(title__iexact=attrs.get('title')).first()
-        if club.members.filter(email__iexact=user.email).count():
-            raise serializers.ValidationError('You have already joined this club')
+        request = self.context['request']
+        club = resolve_club(request, attrs.get('title'))
+        check_can_join(club.members.filter(pk=request.user.pk).exists())
         return attrs
 
     def update(self, instance, validated_data):
-        user = self.context['request'].user
-        instance.members.add(user)
-        instance.save()
+        # a concurrent duplicate may have joined since validate(), then this is a no-op
+        membership.join(self.context['request'].user.pk, [instance])
         return instance
 
 
@@ -114,27 +176,116 @@ class LeaveClubSerializer(serializers.ModelSerializer):
         fields = ['title']
 
     def validate_title(self, value):
-        if not Club.objects.filter(title__iexact=value).count():
+        if resolve_club(self.context['request'], value) is None:
             raise serializers.ValidationError('Club title is incorrect')
         return value
 
     def validate(self, attrs):
-        user = self.context['request'].user
-        club = Club.objects.filter(title__iexact=attrs.get('title')).first()
-        if not club.members.filter(email__iexact=user.email).count():
-            raise serializers.ValidationError('You are not a member of the club')
-        if club.head_of_the_club == user:
-            raise serializers.ValidationError('You can not leave a club, as you are a head of this club. ' +
-                                              'Please delegate your job to another one')
+        request = self.context['request']
+        user = request.user
+        club = resolve_club(request, attrs.get('title'))
+        check_can_leave(club, user, club.members.filter(pk=user.pk).exists())
         return attrs
 
     def update(self, instance, validated_data):
-        user = self.context['request'].user
-        instance.members.remove(user)
-        instance.save()
+        membership.leave(self.context['request'].user.pk, [instance])
         return instance
 
 
+class ClubReferenceField(serializers.Field):
+
+    """
+    Club id (number) or title (string), parsed to ('id', value) / ('title', value).
+    """
+
+    default_error_messages = {
+        'invalid': 'Expected a club id or title.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool):
+            return 'id', data
+        if isinstance(data, str) and data.strip() and len(data) <= 100:
+            return 'title', data
+        self.fail('invalid')
+
+    def to_representation(self, value):
+        return value[1]
+
+
+class BulkMembershipSerializer(serializers.Serializer):
+
+    """
+    Applies every join and leave of the request user in one transaction.
+    Items are checked with the same rules as JoinClubSerializer / LeaveClubSerializer,
+    items that break them are reported and skipped, the rest is applied.
+    """
+
+    join = serializers.ListField(child=ClubReferenceField(), required=False, max_length=100)
+    leave = serializers.ListField(child=ClubReferenceField(), required=False, max_length=100)
+
+    def validate(self, attrs):
+        if not attrs.get('join') and not attrs.get('leave'):
+            raise serializers.ValidationError('Nothing to join or leave')
+        return attrs
+
+    def resolve_clubs(self, references):
+        ids = [value for kind, value in references if kind == 'id']
+        titles = [value for kind, value in references if kind == 'title']
+        condition = Q(pk__in=ids)
+        for title in titles:
+            condition |= Q(title__iexact=title)
+        clubs = Club.objects.only('id', 'title', 'head_of_the_club').filter(condition)
+        resolved = {}
+        for club in clubs:
+            resolved[('id', club.pk)] = club
+            resolved[('title', club.title.upper())] = club
+        return {(kind, value): resolved.get((kind, value.upper() if kind == 'title' else value))
+                for kind, value in references}
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        joins, leaves = validated_data.get('join', []), validated_data.get('leave', [])
+        clubs = self.resolve_clubs(joins + leaves)
+        members = set(Membership.objects
+                      .filter(user_id=user.pk, club_id__in=[club.pk for club in clubs.values() if club])
+                      .values_list('club_id', flat=True))
+
+        added, removed, results = set(), set(), []
+        for action, references in (('join', joins), ('leave', leaves)):
+            for reference in references:
+                result = {'club': reference[1], 'action': action}
+                results.append(result)
+                club = clubs[reference]
+                try:
+                    if club is None:
+                        raise serializers.ValidationError(f'Club {reference[0]} is incorrect')
+                    if action == 'join':
+                        check_can_join(club.pk in members)
+                        members.add(club.pk)
+                        if club.pk in removed:
+                            removed.remove(club.pk)
+                        else:
+                            added.add(club.pk)
+                    else:
+                        check_can_leave(club, user, club.pk in members)
+                        members.remove(club.pk)
+                        if club.pk in added:
+                            added.remove(club.pk)
+                        else:
+                            removed.add(club.pk)
+                except serializers.ValidationError as error:
+                    result.update(status='error', detail=error.detail[0])
+                else:
+                    result['status'] = 'success'
+
+        by_pk = {club.pk: club for club in clubs.values() if club}
+        with transaction.atomic():
+            membership.join(user.pk, [by_pk[pk] for pk in added])
+            membership.leave(user.pk, [by_pk[pk] for pk in removed])
+        return {'results': results}
+
+
 class ChangeClubHeaderSerializer(serializers.Serializer):
 
     title = serializers.CharField(max_length=100, allow_blank=False, required=False)
@@ -144,26 +295,39 @@ class ChangeClubHeaderSerializer(serializers.Serializer):
         pass
 
     def validate_title(self, value):
-        if not Club.objects.filter(title__iexact=value).count():
+        if resolve_club(self.context['request'], value) is None:
             raise serializers.ValidationError('Title is incorrect')
         return value
 
     def validate_new_head_of_the_club(self, value):
-        if not User.objects.filter(email__iexact=value).count():
+        if resolve_user(self.context['request'], value) is None:
             raise serializers.ValidationError("New club header's email is incorrect")
         return value
 
     def validate(self, attrs):
-        user = self.context['request'].user
-        club = Club.objects.filter(title__iexact=attrs.get('title')).first()
-        if club.head_of_the_club != user:
+        request = self.context['request']
+        club = resolve_club(request, attrs.get('title'))
+        new_club_header = resolve_user(request, attrs.get('new_head_of_the_club'))
+        if club.head_of_the_club_id != request.user.pk:
             raise serializers.ValidationError('You are not a club header')
-        if not club.members.filter(email__iexact=attrs.get('new_head_of_the_club')).count():
+        if new_club_header is None or not club.members.filter(pk=new_club_header.pk).exists():
             raise serializers.ValidationError('New club header have to join this club')
         return attrs
 
     def update(self, instance, validated_data):
-        new_club_header = User.objects.filter(email__iexact=validated_data['new_head_of_the_club']).first()
+        new_club_header = resolve_user(self.context['request'], validated_data['new_head_of_the_club'])
         instance.head_of_the_club = new_club_header
-        instance.save()
+        with transaction.atomic():
+            instance.save(update_fields=['head_of_the_club', 'updated_at'])
+            MembershipEvent.record(MembershipEvent.HEAD_CHANGED, [(instance, new_club_header.pk)])
         return instance
+
+
+class MembershipEventSerializer(serializers.ModelSerializer):
+
+    kind = serializers.CharField(source='get_kind_display', read_only=True)
+
+    class Meta:
+        model = MembershipEvent
+        fields = ['id', 'kind', 'club_id', 'club_title', 'user_email', 'created_at']
+        read_only_fields = fields
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.signals import request_started
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from . import authentication, caching, db, search
+from .authentication import token_cache
+from .models import User, Club, ClubQuerySet, MembershipEvent
+
+# user fields other workers must not keep serving from their token caches (see api/authentication.py)
+AUTH_FIELDS = {'is_active', 'is_staff', 'is_superuser', 'status', 'password'}
+
+
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+def invalidate_club(sender, instance, **kwargs):
+    caching.invalidate_clubs(instance.pk)
+
+
+@receiver(post_save, sender=Club)
+@receiver(pre_delete, sender=Club)
+def invalidate_member_lists(sender, instance, created=False, **kwargs):
+    # edits, head changes and the deletion show in the club lists of the members (the memberships
+    # are gone after the delete), a new club only has its head
+    if created:
+        caching.invalidate_user_lists(instance.head_of_the_club_id)
+    else:
+        caching.invalidate_member_lists(instance.pk)
+
+
+@receiver(post_delete, sender=Club)
+def record_club_deletion(sender, instance, **kwargs):
+    # sent inside the transaction of the delete, cascades from deleted users included
+    MembershipEvent.record(MembershipEvent.DELETED, [(instance, instance.head_of_the_club_id)])
+
+
+@receiver(post_save, sender=Club)
+def index_club(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        search.index_clubs([instance.pk])
+
+
+@receiver(post_delete, sender=Club)
+def unindex_club(sender, instance, **kwargs):
+    search.unindex_clubs([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_clubs(sender, instance, created, update_fields=None, **kwargs):
+    # only the fields embedded into club payloads matter (not e.g. last_login)
+    if created or (update_fields is not None and not set(update_fields) & set(ClubQuerySet.USER_FIELDS)):
+        return
+    clubs = set(Club.objects.filter(Q(members=instance) | Q(head_of_the_club=instance)).values_list('pk', flat=True))
+    if clubs:
+        # the user is embedded into these club payloads, their validators have to change too
+        Club.objects.filter(pk__in=clubs).update(updated_at=timezone.now())
+        caching.invalidate_clubs(*clubs)
+        caching.invalidate_member_lists(*clubs)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_deleted_user_clubs(sender, instance, **kwargs):
+    # memberships are gone after the delete, collect the clubs beforehand
+    caching.invalidate_clubs(*Club.objects.filter(members=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, created=False, **kwargs):
+    # logout and rotation delete the token, user deletion cascades to it
+    token_cache.delete(instance.key)
+    if not created:
+        authentication.revoke(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, signal, update_fields=None, **kwargs):
+    token_cache.delete_user(instance.pk)
+    # deletion revokes through the tokens, profile changes (names) are not worth a query
+    if signal is post_save and (update_fields is None or set(update_fields) & AUTH_FIELDS):
+        authentication.revoke(*Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+if settings.DATABASE_HEALTH_CHECKS:
+    request_started.connect(db.check_connections, dispatch_uid='api.db.check_connections')
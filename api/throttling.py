@@ -0,0 +1,117 @@
+"""
+Sliding-window throttling on counters in a shared cache.
+
+DRF's throttles keep a list of request timestamps per client and rewrite it on
+every request. Here a client has one counter per window of the rate's duration,
+moved with the cache's atomic `incr`. The number of requests in the last
+`duration` seconds is estimated from the current and the previous window, the
+latter weighted by how much of it is still inside the sliding window. That is
+two cache operations per request, whatever the rate.
+
+The counters live in the THROTTLE_CACHE cache. It has to be shared (Redis,
+Memcached, database) for the limits to hold across workers. With a per-process
+cache (LocMemCache), every worker enforces the limits on its own: the system
+checks warn about it when WEB_CONCURRENCY is above 1.
+
+Views with a `throttle_scope` get the rate of their scope instead of the
+anon / user rates, e.g. {'auth_url': '300/minute', 'membership': '30/minute'}.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework import throttling
+
+
+class SlidingWindowThrottle(throttling.SimpleRateThrottle):
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, elapsed = divmod(self.now, self.duration)
+        current, previous = f'{self.key}:{int(window)}', f'{self.key}:{int(window) - 1}'
+        self.previous = self.cache.get(previous, 0)
+        # kept for two windows, the current window is the previous one of the next
+        self.cache.add(current, 0, 2 * self.duration)
+        try:
+            self.count = self.cache.incr(current)
+        except ValueError:  # expired in between
+            self.cache.set(current, 1, 2 * self.duration)
+            self.count = 1
+        self.weight = 1 - elapsed / self.duration
+
+        if self.previous * self.weight + self.count <= self.num_requests:
+            return True
+        # rejected requests do not count, clients are not locked out for retrying
+        self.cache.decr(current)
+        self.count -= 1
+        return False
+
+    def wait(self):
+        window_left = self.duration * self.weight
+        if self.count >= self.num_requests or not self.previous:
+            return window_left
+        # until enough of the previous window has slid out for one more request
+        weight = (self.num_requests - self.count - 1) / self.previous
+        return max(0.0, window_left - self.duration * weight)
+
+
+class AnonRateThrottle(SlidingWindowThrottle, throttling.AnonRateThrottle):
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'throttle_scope', None):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class UserRateThrottle(SlidingWindowThrottle, throttling.UserRateThrottle):
+
+    def get_cache_key(self, request, view):
+        if getattr(view, 'throttle_scope', None):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowThrottle):
+    pass
+
+
+class ClientRateThrottle(ScopedRateThrottle):
+
+    """
+    Scoped throttle on the client address alone, for views which do not authenticate
+    the request. Anonymous clients share their budget with the DRF views of the scope.
+    """
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+def throttle_scope(scope):
+    """
+    Set the throttle scope of a function view, goes above @api_view.
+    """
+    def decorator(view):
+        view.cls.throttle_scope = scope
+        return view
+    return decorator
+
+
+@checks.register(checks.Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    if settings.WEB_CONCURRENCY > 1 and isinstance(caches[settings.THROTTLE_CACHE], LocMemCache):
+        return [checks.Warning(
+            f'THROTTLE_CACHE "{settings.THROTTLE_CACHE}" is a per-process cache, each of the '
+            f'{settings.WEB_CONCURRENCY} workers allows the full rates.',
+            hint='Point THROTTLE_CACHE to a cache shared by the workers (Redis, Memcached, database).',
+            id='api.W001')]
+    return []
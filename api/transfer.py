@@ -0,0 +1,198 @@
+"""
+Streaming import / export of clubs with their heads and members.
+
+Every club is one record:
+    - JSONL - {"title": "...", "description": "...", "head_of_the_club": "email", "members": ["email", ...]}
+    - CSV - columns title, description, head_of_the_club, members (emails separated by spaces)
+
+Records are processed in batches, so memory use does not depend on the size of the file
+or of the database. Unknown users are created, existing clubs are kept and get the new members.
+Titles and emails match existing ones case-insensitively, as in the API (api/resolvers.py).
+"""
+import csv
+import io
+import json
+import operator
+from functools import reduce
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import caching, search
+from .models import User, Club, Membership, MembershipEvent
+
+FORMATS = ('csv', 'jsonl')
+CSV_COLUMNS = ['title', 'description', 'head_of_the_club', 'members']
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/jsonl'}
+LOOKUP_CHUNK = 500  # values per OR chain of `__iexact` terms, SQLite caps expression trees at a depth of 1000
+
+
+def guess_format(name, default='jsonl'):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return extension if extension in FORMATS else default
+
+
+def read_records(lines, format):
+    """
+    Parse an iterable of text lines into club records.
+    """
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            yield number, {'title': row.get('title'),
+                           'description': row.get('description') or '',
+                           'head_of_the_club': row.get('head_of_the_club'),
+                           'members': (row.get('members') or '').split()}
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValidationError(f'Line {number}: invalid JSON')
+            if not isinstance(record, dict):
+                raise ValidationError(f'Line {number}: expected an object')
+            yield number, record
+
+
+def clean_record(number, record):
+    title = record.get('title')
+    head = record.get('head_of_the_club')
+    members = record.get('members') or []
+    if not isinstance(title, str) or not title.strip() or len(title) > 100:
+        raise ValidationError(f'Line {number}: invalid title')
+    if not isinstance(head, str) or not head.strip():
+        raise ValidationError(f'Line {number}: invalid head_of_the_club')
+    if not isinstance(members, list) or not all(isinstance(member, str) for member in members):
+        raise ValidationError(f'Line {number}: members must be a list of emails')
+    return {'title': title,
+            'description': record.get('description') or '',
+            'head_of_the_club': head,
+            'members': [head] + members}
+
+
+def spellings(queryset, field, values):
+    """
+    {lower-cased value: spelling} of the values, as stored if they match a row case-insensitively,
+    as first given otherwise. Every term of the lookup is served by the field's CaseInsensitiveIndex.
+    """
+    values = list(dict.fromkeys(values))
+    found = {}
+    for start in range(0, len(values), LOOKUP_CHUNK):
+        lookup = reduce(operator.or_, (Q(**{f'{field}__iexact': value})
+                                       for value in values[start:start + LOOKUP_CHUNK]), Q(pk__in=[]))
+        found.update((value.lower(), value) for value in queryset.filter(lookup).values_list(field, flat=True))
+    for value in values:
+        found.setdefault(value.lower(), value)
+    return found
+
+
+def import_batch(records):
+    titles = spellings(Club.objects.all(), 'title', [record['title'] for record in records])
+    emails = spellings(User.objects.all(), 'email', [email for record in records for email in record['members']])
+    records = [dict(record, title=titles[record['title'].lower()],
+                    head_of_the_club=emails[record['head_of_the_club'].lower()],
+                    members=[emails[email.lower()] for email in record['members']])
+               for record in records]
+
+    emails = set(emails.values())
+    User.objects.bulk_create([User(email=email, username=email) for email in emails], ignore_conflicts=True)
+
+    titles = [record['title'] for record in records]
+    existing = set(Club.objects.filter(title__in=titles).values_list('title', flat=True))
+    Club.objects.bulk_create([Club(title=record['title'],
+                                   description=record['description'],
+                                   head_of_the_club_id=record['head_of_the_club'])
+                              for record in records],
+                             ignore_conflicts=True)
+    clubs = dict(Club.objects.filter(title__in=titles).values_list('title', 'id'))
+
+    # conflicts are ignored, so the new clubs and memberships are told apart beforehand for the event log
+    members = set(Membership.objects.filter(club_id__in=clubs.values()).values_list('club_id', 'user_id'))
+    created, joined = [], []
+    for record in records:
+        club, head = Club(pk=clubs[record['title']], title=record['title']), record['head_of_the_club']
+        if record['title'] not in existing:
+            existing.add(record['title'])
+            created.append((club, head))
+            members.add((club.pk, head))  # joining is part of the creation for the head
+        for email in set(record['members']):
+            if (club.pk, email) not in members:
+                members.add((club.pk, email))
+                joined.append((club, email))
+    MembershipEvent.record(MembershipEvent.CREATED, created)
+    MembershipEvent.record(MembershipEvent.JOINED, joined)
+
+    Membership.objects.bulk_create([Membership(club_id=clubs[record['title']], user_id=email)
+                                    for record in records for email in set(record['members'])],
+                                   ignore_conflicts=True)
+
+    # conflicts are ignored, so the number of inserted rows is unknown: recount the touched clubs
+    counts = Membership.objects.filter(club_id=OuterRef('pk')).order_by() \
+                               .values('club_id').annotate(count=Count('*')).values('count')
+    Club.objects.filter(pk__in=clubs.values()).update(member_count=Coalesce(Subquery(counts), 0),
+                                                      version=F('version') + 1,
+                                                      updated_at=timezone.now())
+    # bulk_create does not send post_save
+    search.index_clubs(clubs.values())
+    caching.invalidate_clubs(*clubs.values())
+    caching.invalidate_member_lists(*clubs.values())
+
+
+def import_records(records, batch_size=1000):
+    """
+    Import (line number, record) pairs in one transaction, `batch_size` records at a time.
+    Returns the number of imported records.
+    """
+    records = (clean_record(number, record) for number, record in records)
+    imported = 0
+    with transaction.atomic():
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return imported
+            import_batch(batch)
+            imported += len(batch)
+
+
+def export_records(chunk_size=2000):
+    """
+    Yield every club as a record, reading clubs and memberships with server-side cursors.
+    """
+    clubs = Club.objects.order_by('id').values_list('id', 'title', 'description', 'head_of_the_club_id')
+    memberships = Membership.objects.order_by('club_id', 'user_id').values_list('club_id', 'user_id')
+    members = groupby(memberships.iterator(chunk_size=chunk_size), key=lambda membership: membership[0])
+
+    club_id, emails = next(members, (None, ()))
+    for pk, title, description, head in clubs.iterator(chunk_size=chunk_size):
+        while club_id is not None and club_id < pk:
+            club_id, emails = next(members, (None, ()))
+        record = {'title': title, 'description': description, 'head_of_the_club': head, 'members': []}
+        if club_id == pk:
+            record['members'] = [email for _, email in emails if email != head]
+        yield record
+
+
+def render_records(records, format):
+    """
+    Serialize records to chunks of text, one record per line.
+    """
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for record in records:
+            writer.writerow(dict(record, members=' '.join(record['members'])))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for record in records:
+            yield json.dumps(record) + '\n'
@@ -13,24 +13,59 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path
+from django.utils.module_loading import import_string
 
-from . import views
+from . import views, async_views
+
+
+def lazy_view(view_class):
+    """
+    A class-based view imported on its first request instead of at startup,
+    for views pulling in subsystems most workers never use.
+    """
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(view_class).as_view()
+        return view(request, *args, **kwargs)
+    wrapper.csrf_exempt = True  # as every DRF view, checked before the first request imports it
+    return wrapper
 
 
 urlpatterns = [
 
     path('get_auth_url/', views.get_auth_url, name='get-auth-url'),
-    path('microsoft/login/', views.OutlookLogin.as_view(), name='user-login'),
+    path('logout/', lazy_view('rest_auth.views.LogoutView'), name='user-logout'),
 
     path('user_profile/', views.UserProfileRUDView.as_view(), name='user-profile'),
+    path('user_events/', views.UserEventsView.as_view(), name='user-events'),
+    path('my_clubs/', views.MyClubsView.as_view(), name='my-clubs'),
+    path('my_clubs/head/', views.MyClubsView.as_view(relation='clubs'), name='my-clubs-head'),
 
     path('get_clubs/', views.ListClubsView.as_view(), name='clubs-view'),
+    path('search_clubs/', views.SearchClubsView.as_view(), name='clubs-search'),
     path('club_profile/', views.RUDClubView.as_view(), name='club-view'),
+    path('clubs/<int:pk>/members/', views.ClubMembersView.as_view(), name='club-members'),
+    path('clubs/<int:pk>/events/', views.ClubEventsView.as_view(), name='club-events'),
 
     path('create_club/', views.CreateClubView.as_view(), name='club-create'),
+    path('import_clubs/', views.ImportClubsView.as_view(), name='clubs-import'),
+    path('export_clubs/', views.ExportClubsView.as_view(), name='clubs-export'),
     path('join_club/', views.JoinClubView.as_view(), name='join-club'),
     path('leave_club/', views.LeaveClubView.as_view(), name='leave-club'),
-    path('change_club_header/', views.ChangeClubHeaderView.as_view(), name='change-club-header')
+    path('bulk_membership/', views.BulkMembershipView.as_view(), name='bulk-membership'),
+    path('change_club_header/', views.ChangeClubHeaderView.as_view(), name='change-club-header'),
+
+    # async variants of the read endpoints for ASGI deployments
+    path('async/get_auth_url/', async_views.get_auth_url, name='async-get-auth-url'),
+    path('async/get_clubs/', async_views.list_clubs, name='async-clubs-view'),
+    path('async/club_profile/', async_views.retrieve_club, name='async-club-view'),
 
 ]
+
+if not settings.API_ONLY:
+    urlpatterns.append(path('microsoft/login/', lazy_view('api.login.OutlookLogin'), name='user-login'))
@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomPagination(CursorPagination):
+
+    """
+    Keyset pagination: pages are addressed by an opaque cursor built from
+    the ordering key, so fetching a page costs the same wherever it is.
+
+    query - {'cursor': 'value of next / previous link',
+             'page_size': 'number of items per page (optional)'}
+    """
+
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(CustomPagination):
+
+    """
+    Cursor pagination for orderings on values many rows share (member counts, join times).
+
+    CursorPagination positions a page on the first ordering field only and skips the rows
+    sharing its value with an offset, which is slow for large groups of equal values and
+    undefined without a tiebreaker. Here the ordering always ends with `unique_field` and
+    the position holds every ordering field, so pages are filtered on the whole key and
+    never repeat or skip a row.
+    """
+
+    unique_field = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if self.unique_field not in (field.lstrip('-') for field in ordering):
+            ordering += (self.unique_field,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        queryset = queryset.order_by(*(reverse_ordering(self.ordering) if reverse else self.ordering))
+        if position is not None:
+            queryset = queryset.filter(self.after(self.decode_position(position, queryset), reverse))
+        # one row more to know whether a page follows
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = self._get_position_from_instance(results[-1], self.ordering) \
+            if len(results) > self.page_size else None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+        return self.page
+
+    def decode_position(self, position, queryset):
+        """
+        Values of the ordering fields at the position, as their fields' Python values.
+        """
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(self.ordering) or None in values:
+                raise ValueError(position)
+            return [ordering_field(queryset, field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, values, reverse):
+        """
+        Rows following the position in the ordering (preceding it for a reversed cursor).
+        """
+        condition, equal = Q(), Q()
+        for field, value in zip(self.ordering, values):
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{field.lstrip("-")}__{lookup}': value})
+            equal &= Q(**{field.lstrip('-'): value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        # positions are unique, so DRF's links never need an offset
+        fields = [field.lstrip('-') for field in ordering]
+        values = [instance[field] if isinstance(instance, dict) else getattr(instance, field) for field in fields]
+        return json.dumps([str(value) for value in values])
+
+
+def ordering_field(queryset, name):
+    """
+    The model field or annotation output field the queryset is ordered by.
+    """
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class MembersPagination(KeysetPagination):
+    ordering = 'email'
+    unique_field = 'email'  # ties on joined_at, e.g. every membership of the backfill
+
+
+class EventsPagination(CustomPagination):
+    ordering = '-id'  # newest first
+
+
+class SearchPagination(PageNumberPagination):
+
+    """
+    Ranked results have no stable keyset, so they are paginated by page number.
+
+    query - {'page': 'page number (optional)',
+             'page_size': 'number of items per page (optional)'}
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class AsyncCapableMiddleware:
+
+    """
+    Middleware for both WSGI and ASGI stacks. Django 3.1 runs a sync-only middleware of an
+    async stack on its one thread for sync code, which serializes every request through it.
+    Subclasses implement `call(request)` for a sync and `acall(request)` for an async stack.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # how Django tells an async middleware instance, as for MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        return self.call(request)
+
+    def call(self, request):
+        raise NotImplementedError
+
+    async def acall(self, request):
+        raise NotImplementedError
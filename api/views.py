@@ -1,51 +1,44 @@
+import codecs
+
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from urllib.parse import urlencode
 
-from allauth.socialaccount.providers.microsoft.views import MicrosoftGraphOAuth2Adapter
-from allauth.socialaccount.providers.oauth2.client import OAuth2Client
-from rest_auth.registration.serializers import SocialLoginSerializer
-from allauth.account.adapter import get_adapter
-from rest_auth.views import LoginView
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.shortcuts import get_object_or_404
 
 from rest_framework import response, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.generics import RetrieveUpdateAPIView, CreateAPIView, ListAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.generics import RetrieveUpdateAPIView, CreateAPIView, ListAPIView, RetrieveUpdateDestroyAPIView, GenericAPIView
 from rest_framework.permissions import IsAuthenticated
 
-from .serializers import RUDUserInfoSerializer, CreateClubSerializer, RetrieveClubsSerializer, JoinClubSerializer, LeaveClubSerializer, ChangeClubHeaderSerializer
-from .models import User, Club
-from .permissions import IsOwnerOrReadOnly, IsClubOwnerOrReadOnly, IsAdmin, IsValidEmail, IsValidTitle
+from .serializers import RUDUserInfoSerializer, ClubMemberSerializer, CreateClubSerializer, RetrieveClubsSerializer, JoinClubSerializer, LeaveClubSerializer, ChangeClubHeaderSerializer, ListClubsSerializer, BulkMembershipSerializer, MembershipEventSerializer
+from .models import User, Club, ClubQuerySet, MembershipEvent
+from .permissions import IsOwnerOrReadOnly, IsClubOwnerOrReadOnly, IsAdmin, IsValidEmail, IsValidTitle, IsClubHeadOrAdmin
+from .resolvers import resolve_club, resolve_user
+from .conditional import ConditionalGetMixin
+from .idempotency import IdempotencyMixin
+from .throttling import throttle_scope
+from .utils import KeysetPagination, MembersPagination, SearchPagination, EventsPagination
+from . import caching, fast_serializers, search, transfer
 from InnoClubs import settings
 
 
-class SocialLoginView(LoginView):
-    serializer_class = SocialLoginSerializer
-
-    def process_login(self):
-        get_adapter(self.request).login(self.request, self.user)
-
-
-class OutlookLogin(SocialLoginView):
-
-    adapter_class = MicrosoftGraphOAuth2Adapter
-
-    callback_url = settings.CALLBACK_URL
-
-    client_class = OAuth2Client
-    queryset = ''
-
-
 """
 Login process:
 - get login url from /api/get_auth_url/
 - go to that page and get code finally
 - POST request to /api/microsoft/login/ with body {'code': code} and get 'key'
+  (api/login.py, served by workers with the full settings profile)
 """
 
 
-class UserProfileRUDView(RetrieveUpdateDestroyAPIView):
+class UserProfileRUDView(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
 
     """
         NEED AUTHENTICATION:
@@ -53,6 +46,7 @@ class UserProfileRUDView(RetrieveUpdateDestroyAPIView):
 
         GET:
         body - {'email': 'user email'}
+        headers - {'If-None-Match': 'ETag of the previous response (optional)'}
 
         PUT:
         Body - {'email': 'user email',
@@ -66,15 +60,20 @@ class UserProfileRUDView(RetrieveUpdateDestroyAPIView):
 
     serializer_class = RUDUserInfoSerializer
     permission_classes = [IsAuthenticated, IsValidEmail, IsOwnerOrReadOnly]
+    query_budget = {'GET': 2, 'PUT': 5}  # DELETE cascades through every related model
 
     def get_object(self):
-        email = self.request.data.get('email', None)
-        self.check_permissions(self.request)
-        self.check_object_permissions(self.request, User.objects.filter(email__iexact=email).first())
-        return User.objects.filter(email__iexact=email).first()
+        # permissions (IsValidEmail included) were checked in initial()
+        user = resolve_user(self.request)
+        self.check_object_permissions(self.request, user)
+        return user
+
+    def get_validators(self):
+        user = self.get_object()
+        return (user.pk, user.updated_at), user.updated_at
 
     def get(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        return self.conditional_get(request, lambda: self.retrieve(request, *args, **kwargs))
 
     def put(self, request, *args, **kwargs):  # update
         return self.update(request, *args, **kwargs)
@@ -83,6 +82,15 @@ class UserProfileRUDView(RetrieveUpdateDestroyAPIView):
         self.destroy(request, *args, **kwargs)
         return response.Response(data={'result': 'ok'}, status=status.HTTP_200_OK)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # memberships go away with the user, keep the counters in step
+            clubs = Club.objects.filter(members=instance).exclude(head_of_the_club=instance)
+            MembershipEvent.record(MembershipEvent.LEFT, [(club, instance.pk) for club in clubs.only('id', 'title')])
+            clubs.update_membership(-1)
+            # clubs headed by the user are deleted with it, see signals.record_club_deletion
+            instance.delete()
+
 
 class CreateClubView(CreateAPIView):
 
@@ -99,28 +107,265 @@ class CreateClubView(CreateAPIView):
 
     serializer_class = CreateClubSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
+    query_budget = 7
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
 
-class ListClubsView(ListAPIView):
+class ImportClubsView(GenericAPIView):
 
     """
+        NEED ADMIN RULES
+
         NEED AUTHENTICATION:
         headers - {'Authorization': f'Token {token itself}'}
 
-        GET
+        POST (multipart):
+        body - {'file': 'CSV or JSONL file, see api/transfer.py',
+                'file_format': 'csv / jsonl (optional, guessed from the file name)'}
     """
 
-    serializer_class = RetrieveClubsSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'This field is required.'})
+        format = request.data.get('file_format') or transfer.guess_format(upload.name)
+        if format not in transfer.FORMATS:
+            raise ValidationError({'file_format': f'Must be one of: {", ".join(transfer.FORMATS)}'})
+        # uploads are read line by line, large ones from a temporary file
+        lines = codecs.iterdecode(upload, 'utf-8')
+        imported = transfer.import_records(transfer.read_records(lines, format))
+        return response.Response(data={'status': 'success', 'imported': imported}, status=status.HTTP_200_OK)
+
+
+class ExportClubsView(GenericAPIView):
+
+    """
+        NEED ADMIN RULES
+
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET:
+        query - {'file_format': 'jsonl (default) / csv'}
+    """
+
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        format = request.query_params.get('file_format', 'jsonl')
+        if format not in transfer.FORMATS:
+            raise ValidationError({'file_format': f'Must be one of: {", ".join(transfer.FORMATS)}'})
+        chunks = transfer.render_records(transfer.export_records(), format)
+        export = StreamingHttpResponse(chunks, content_type=transfer.CONTENT_TYPES[format])
+        export['Content-Disposition'] = f'attachment; filename="clubs.{format}"'
+        return export
+
+
+class ListClubsView(ConditionalGetMixin, ListAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET:
+        headers - {'If-None-Match': 'ETag of the previous response (optional)'}
+        query - {'cursor': 'value of next / previous link (optional)',
+                 'page_size': 'number of clubs per page (optional)',
+                 'members': 'all (default) / none / number of members to embed (optional)',
+                 'ordering': 'id (default) / -member_count for the most popular first (optional)',
+                 'stream': 'true to get every club as one streamed JSON array, without pagination (optional)'}
+    """
+
+    serializer_class = ListClubsSerializer  # reference for the fast path below, see api/fast_serializers.py
     permission_classes = [IsAuthenticated]
+    query_budget = 3
+    pagination_class = KeysetPagination  # clubs with the same member count are ordered by id
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['id', 'member_count']
+    ordering = ['id']
+
+    def get_members_limit(self):
+        value = self.request.query_params.get('members', 'all')
+        if value == 'all':
+            return None
+        if value == 'none':
+            return 0
+        if not value.isdigit():
+            raise ValidationError({'members': 'Must be "all", "none" or a non-negative number'})
+        return int(value)
+
+    def get_validators(self):
+        # a new, changed or deleted club moves the latest update or the count. No Last-Modified:
+        # deleting a club does not move the latest update forward, only the ETag sees it
+        state = Club.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        return (self.request.build_absolute_uri(), state['count'], state['updated_at']), None
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional_get(request, lambda: self.list(request, *args, **kwargs))
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == 'true':
+            return self.stream(request)
+        # pages hold absolute next / previous links, so the whole URL is the key
+        data = caching.get_or_set(caching.list_key(request.build_absolute_uri()), self.build_page)
+        return Response(data)
+
+    def build_page(self):
+        limit = self.get_members_limit()
+        rows = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return fast_serializers.serialize_clubs(rows, limit)
+        return self.get_paginated_response(fast_serializers.serialize_clubs(page, limit)).data
+
+    def stream(self, request):
+        # neither paginated nor cached, rows are read and written out chunk by chunk
+        rows = self.filter_queryset(self.get_queryset())
+        clubs = fast_serializers.iter_clubs(rows, self.get_members_limit(), settings.CLUB_STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(fast_serializers.stream_json(clubs), content_type='application/json')
 
     def get_queryset(self):
-        return Club.objects.all()
+        return fast_serializers.club_rows(Club.objects.all())
 
 
-class RUDClubView(RetrieveUpdateDestroyAPIView):
+class SearchClubsView(ListAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET:
+        query - {'q': 'words to look for in club titles and descriptions',
+                 'page': 'page number (optional)',
+                 'page_size': 'number of clubs per page (optional)'}
+
+        Clubs matching every word (as a prefix), best matches first, without members.
+    """
+
+    serializer_class = ListClubsSerializer  # reference for the fast path, see api/fast_serializers.py
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        if not search.terms(query):
+            raise ValidationError({'q': 'This field is required.'})
+        return fast_serializers.club_rows(search.search_clubs(query).order_by('-rank', 'id'))
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(fast_serializers.serialize_clubs(page, members_limit=0))
+
+
+class ClubMembersView(ListAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET /api/clubs/<club id>/members/:
+        query - {'cursor': 'value of next / previous link (optional)',
+                 'page_size': 'number of members per page (optional)',
+                 'ordering': 'email (default) / joined_at / -joined_at for the newest members first (optional)'}
+    """
+
+    serializer_class = ClubMemberSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = 2
+    pagination_class = MembersPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['email', 'joined_at']
+    ordering = ['email']
+
+    def get_queryset(self):
+        club = get_object_or_404(Club.objects.only('id'), pk=self.kwargs['pk'])
+        # the annotations reuse the join of the filter, sorting by join time uses (club_id, joined_at)
+        return User.objects.filter(membership__club=club) \
+                           .annotate(joined_at=F('membership__joined_at'), role=F('membership__role')) \
+                           .only(*ClubQuerySet.USER_FIELDS)
+
+
+class ClubEventsView(ListAPIView):
+
+    """
+        NEED AUTHENTICATION (head of the club or admin):
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET /api/clubs/<club id>/events/:
+        query - {'cursor': 'value of next / previous link (optional)',
+                 'page_size': 'number of events per page (optional)'}
+
+        Events, newest first - {'id': event id, 'kind': 'joined / left / head_changed / created / deleted',
+                                'club_id': club id, 'club_title': 'title at the time of the event',
+                                'user_email': 'email', 'created_at': 'datetime'}
+    """
+
+    serializer_class = MembershipEventSerializer
+    permission_classes = [IsAuthenticated, IsClubHeadOrAdmin]
+    query_budget = 2
+    pagination_class = EventsPagination
+
+    def get_queryset(self):
+        club = get_object_or_404(Club.objects.only('id', 'head_of_the_club'), pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, club)
+        return MembershipEvent.objects.filter(club_id=club.pk)
+
+
+class UserEventsView(ListAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET:
+        query - {'cursor': 'value of next / previous link (optional)',
+                 'page_size': 'number of events per page (optional)'}
+
+        Events of the request user, newest first, see ClubEventsView.
+    """
+
+    serializer_class = MembershipEventSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = 1
+    pagination_class = EventsPagination
+
+    def get_queryset(self):
+        return MembershipEvent.objects.filter(user_email=self.request.user.pk)
+
+
+class MyClubsView(ListAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}'}
+
+        GET /api/my_clubs/: clubs the request user is a member of
+        GET /api/my_clubs/head/: clubs the request user is the head of
+
+        Clubs ordered by title, without members.
+    """
+
+    serializer_class = ListClubsSerializer  # reference for the fast path, see api/fast_serializers.py
+    permission_classes = [IsAuthenticated]
+    query_budget = 1
+    relation = 'club_set'  # reverse relation of User: 'club_set' (members) or 'clubs' (heads)
+
+    def get_queryset(self):
+        clubs = getattr(self.request.user, self.relation).all()
+        return fast_serializers.club_rows(clubs.order_by('title'))
+
+    def list(self, request, *args, **kwargs):
+        key = caching.user_clubs_key(request.user.pk, self.relation)
+        return Response(caching.get_or_set(
+            key, lambda: fast_serializers.serialize_clubs(self.get_queryset(), members_limit=0)))
+
+
+class RUDClubView(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
 
     """
         NEED AUTHENTICATION:
@@ -128,6 +373,7 @@ class RUDClubView(RetrieveUpdateDestroyAPIView):
 
         GET:
         body - {'title': 'title of the club'}
+        headers - {'If-None-Match': 'ETag of the previous response (optional)'}
 
         PUT:
         Body - {'title': 'title of the club (must be unique)',
@@ -140,15 +386,20 @@ class RUDClubView(RetrieveUpdateDestroyAPIView):
 
     serializer_class = RetrieveClubsSerializer
     permission_classes = [IsAuthenticated, IsClubOwnerOrReadOnly, IsValidTitle]
+    query_budget = {'GET': 2, 'PUT': 6, 'DELETE': 6}
 
     def get_object(self):
-        title = self.request.data.get('title', None)
-        self.check_permissions(self.request)
-        self.check_object_permissions(self.request, Club.objects.filter(title__iexact=title).first())
-        return Club.objects.filter(title__iexact=title).first()
+        # permissions (IsValidTitle included) were checked in initial()
+        club = resolve_club(self.request)
+        self.check_object_permissions(self.request, club)
+        return club
+
+    def get_validators(self):
+        club = self.get_object()
+        return (club.pk, club.version, club.updated_at), club.updated_at
 
     def get(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        return self.conditional_get(request, lambda: self.retrieve(request, *args, **kwargs))
 
     def put(self, request, *args, **kwargs):  # update
         return self.update(request, *args, **kwargs)
@@ -157,12 +408,18 @@ class RUDClubView(RetrieveUpdateDestroyAPIView):
         self.destroy(request, *args, **kwargs)
         return response.Response(data={'status': 'success'}, status=status.HTTP_200_OK)
 
+    def retrieve(self, request, *args, **kwargs):
+        club = self.get_object()
+        data = caching.get_or_set(caching.club_key(club.pk), lambda: self.get_serializer(club).data)
+        return Response(data)
 
-class JoinClubView(RetrieveUpdateAPIView):
+
+class JoinClubView(IdempotencyMixin, RetrieveUpdateAPIView):
 
     """
         NEED AUTHENTICATION:
-        headers - {'Authorization': f'Token {token itself}'}
+        headers - {'Authorization': f'Token {token itself}',
+                   'Idempotency-Key': 'unique key of the request, to retry it safely (optional)'}
 
         PUT:
         body - {'title': 'title of the club'}
@@ -170,21 +427,23 @@ class JoinClubView(RetrieveUpdateAPIView):
 
     serializer_class = JoinClubSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 5
+    throttle_scope = 'membership'
 
     def get_object(self):
-        title = self.request.data.get('title', None)
-        return Club.objects.filter(title__iexact=title).first()
+        return resolve_club(self.request)
 
     def put(self, request, *args, **kwargs):
         self.update(request, *args, **kwargs)
         return response.Response(data={'status': 'success'}, status=status.HTTP_200_OK)
 
 
-class LeaveClubView(RetrieveUpdateAPIView):
+class LeaveClubView(IdempotencyMixin, RetrieveUpdateAPIView):
 
     """
         NEED AUTHENTICATION:
-        headers - {'Authorization': f'Token {token itself}'}
+        headers - {'Authorization': f'Token {token itself}',
+                   'Idempotency-Key': 'unique key of the request, to retry it safely (optional)'}
 
         PUT:
         body - {'title': 'title of the club'}
@@ -192,16 +451,43 @@ class LeaveClubView(RetrieveUpdateAPIView):
 
     serializer_class = LeaveClubSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 5
+    throttle_scope = 'membership'
 
     def get_object(self):
-        title = self.request.data.get('title', None)
-        return Club.objects.filter(title__iexact=title).first()
+        return resolve_club(self.request)
 
     def put(self, request, *args, **kwargs):
         self.update(request, *args, **kwargs)
         return response.Response(data={'status': 'success'}, status=status.HTTP_200_OK)
 
 
+class BulkMembershipView(IdempotencyMixin, GenericAPIView):
+
+    """
+        NEED AUTHENTICATION:
+        headers - {'Authorization': f'Token {token itself}',
+                   'Idempotency-Key': 'unique key of the request, to retry it safely (optional)'}
+
+        PUT:
+        body - {'join': ['title or id of the club', ...],
+                'leave': ['title or id of the club', ...]}
+
+        Response - {'results': [{'club': 'title or id', 'action': 'join / leave',
+                                 'status': 'success / error', 'detail': 'reason of the error'}, ...]}
+    """
+
+    serializer_class = BulkMembershipSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = 5
+    throttle_scope = 'membership'
+
+    def put(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return response.Response(data=serializer.save(), status=status.HTTP_200_OK)
+
+
 class ChangeClubHeaderView(RetrieveUpdateAPIView):
 
     """
@@ -215,19 +501,24 @@ class ChangeClubHeaderView(RetrieveUpdateAPIView):
 
     serializer_class = ChangeClubHeaderSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = 6
 
     def get_object(self):
-        title = self.request.data.get('title', None)
-        return Club.objects.filter(title__iexact=title).first()
+        return resolve_club(self.request)
 
     def put(self, request, *args, **kwargs):
         self.update(request, *args, **kwargs)
         return response.Response(data={'status': 'success'}, status=status.HTTP_200_OK)
 
 
+@throttle_scope('auth_url')
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
 def get_auth_url(request):
+    return Response(auth_url_data())
+
+
+def auth_url_data():
     url = settings.AUTHENTICATION_URL
     params = {'client_id': settings.CLIENT_ID,
               'redirect_uri': settings.CALLBACK_URL,
@@ -236,7 +527,7 @@ def get_auth_url(request):
     data = {
         'auth_url': url + '?' + urlencode(params)
     }
-    return Response(data)
+    return data
 
 
 def home(request):